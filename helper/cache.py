@@ -0,0 +1,99 @@
+# binary cache of compiled instances stored next to the .sop files
+
+import hashlib
+import os
+import shutil
+import tempfile
+import numpy as np
+from helper.parser import parser
+from helper.instance import SOPInstance
+
+# name of the cache directory inside the directory of the .sop files
+CACHE_DIRECTORY = '.sop_cache'
+
+# has to be increased whenever the arrays of SOPInstance change
+CACHE_VERSION = 2
+
+
+def file_hash(path):
+    """
+
+    :param path: path to a file
+    :return: hex digest of the content of the file
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_path(sop_path):
+    """
+
+    :param sop_path: path to a .sop file
+    :return: directory of the cached arrays of the instance; it depends on the content of the file, so a
+             modified file gets a new entry
+    """
+    name = os.path.basename(sop_path)[:-4]
+    entry = '{0}-{1}-v{2}'.format(name, file_hash(sop_path)[:16], CACHE_VERSION)
+    return os.path.join(os.path.dirname(sop_path), CACHE_DIRECTORY, entry)
+
+
+def write_cache(instance, directory):
+    """
+    Save the arrays of the instance and of its indexes (transitive closure and reduction, live arcs, see
+    SOPInstance.index_fields) as .npy files. The files are written to a temporary directory which is
+    renamed at the end, so other processes never see a partially written entry. Outdated entries of the same
+    instance are removed.
+
+    :param instance: SOPInstance
+    :param directory: cache directory of the instance (see cache_path)
+    """
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+
+    temporary = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    for field, array in instance.arrays(indexes=True).items():
+        np.save(os.path.join(temporary, field + '.npy'), np.ascontiguousarray(array))
+
+    try:
+        os.rename(temporary, directory)
+    except OSError:  # written by another process in the meantime
+        shutil.rmtree(temporary, ignore_errors=True)
+
+    # entries of older versions of the file or of the cache format
+    name = os.path.basename(directory).rsplit('-', 2)[0]
+    for entry in os.listdir(parent):
+        if entry != os.path.basename(directory) and entry.rsplit('-', 2)[0] == name:
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+
+def load_instance(sop_path, show_comments=False, cache=True):
+    """
+
+    :param sop_path: path to a .sop file, e.g. 'Data/course_benchmark_instances/ESC07.sop'
+    :param show_comments: console output like the parser
+    :param cache: use (and create) the binary cache
+    :return: SOPInstance
+
+    Loads the compiled instance from the binary cache next to the .sop file. If there is no up to date entry
+    the file gets parsed and compiled once and the entry is created. Cached arrays are opened as read-only
+    memory maps, so processes loading the same instance share the pages instead of holding private copies.
+    The precedence graph and the live arcs are restored from the cache as well instead of being rebuilt.
+    """
+    name = os.path.basename(sop_path)[:-4]
+    if not cache:
+        return SOPInstance(parser(sop_path, show_comments), name)
+
+    directory = cache_path(sop_path)
+    fields = SOPInstance.fields + SOPInstance.index_fields
+    if not all(os.path.isfile(os.path.join(directory, field + '.npy')) for field in fields):
+        if show_comments:
+            print("Compiling '{0}' into cache '{1}'".format(sop_path, directory))
+        write_cache(SOPInstance(parser(sop_path, show_comments), name), directory)
+    elif show_comments:
+        print("Loading '{0}' from cache '{1}'\n".format(sop_path, directory))
+
+    arrays = {field: np.load(os.path.join(directory, field + '.npy'), mmap_mode='r') for field in fields}
+    return SOPInstance.from_arrays(name, **arrays)
@@ -0,0 +1,79 @@
+# candidate lists: the cheapest live successors and predecessors of every vertex
+
+import numpy as np
+
+
+class CandidateLists:
+    """
+    The k cheapest live arcs (see helper.precedence.LiveArcs) leaving and entering every vertex.
+
+    Constructions only need to look at a few cheap successors of the last vertex, local searches only at moves
+    which add a cheap arc. The lists are built for all vertices at once: the costs of the dead arcs are set to
+    the largest value and every row of the matrix is sorted by one vectorized (stable) argsort.
+
+    Attributes:
+        k - length of the lists
+        successors - (n, k) int32 array, cheapest live successors of every vertex in ascending order of cost
+                     (ties by vertex), padded with -1 if a vertex has less than k live successors
+        successor_count - number of valid entries of every row of successors
+        predecessors, predecessor_count - same for the arcs entering every vertex
+        live - mask of the live arcs
+    """
+
+    def __init__(self, instance, k):
+        """
+
+        :param instance: SOPInstance
+        :param k: number of candidates of every vertex
+        """
+        self.k = k = max(1, min(k, instance.n - 1))
+        self.live = live = instance.live_arcs.mask
+        costs = np.where(live, instance.costs, np.iinfo(np.int32).max)
+
+        self.successors, self.successor_count = self._nearest(costs, live, k)
+        self.predecessors, self.predecessor_count = self._nearest(costs.T, live.T, k)
+
+    @staticmethod
+    def _nearest(costs, live, k):
+        """
+        :return: (n, k) array of the columns of the k smallest live entries of every row and their number
+        """
+        # stable sort: ties by vertex
+        nearest = np.argsort(costs, axis=1, kind='stable')[:, :k].astype(np.int32)
+        valid = np.take_along_axis(live, nearest, axis=1)
+        nearest[~valid] = -1
+        return nearest, valid.sum(axis=1).astype(np.int32)
+
+    def successors_of(self, vertex):
+        """
+        :return: candidate successors of the vertex (without padding)
+        """
+        return self.successors[vertex, :self.successor_count[vertex]]
+
+    def predecessors_of(self, vertex):
+        """
+        :return: candidate predecessors of the vertex (without padding)
+        """
+        return self.predecessors[vertex, :self.predecessor_count[vertex]]
+
+    def restrict(self, last, is_ready):
+        """
+        Restriction of a batched construction (one partial path per row) to the candidate lists: every row is
+        extended by one of the ready vertices among the candidate successors of its last vertex, or by any ready
+        vertex if none of them is ready.
+
+        :param last: last vertex of every row
+        :param is_ready: function (rows, columns) -> bool array of the shape of columns, True if the vertex
+                         columns[r, c] can be visited next in row rows[r] (columns is broadcast against rows)
+        :return: tuple (columns, ready, full, ready_full):
+                 columns - (m, k) candidate successors of the last vertices (padding replaced by 0)
+                 ready - (m, k) bool array, True for the ready candidates
+                 full - rows without a ready candidate
+                 ready_full - (len(full), n) bool array, ready vertices of these rows reachable by a live arc
+        """
+        nearest = self.successors[last]
+        columns = nearest.clip(0)
+        ready = (nearest >= 0) & is_ready(np.arange(last.size), columns)
+        full = np.flatnonzero(~ready.any(axis=1))
+        ready_full = is_ready(full, np.arange(self.live.shape[0])[np.newaxis, :]) & self.live[last[full]]
+        return columns, ready, full, ready_full
@@ -0,0 +1,41 @@
+# ready set of vertices for constructing feasible paths vertex by vertex
+
+import numpy as np
+
+
+class ReadySet:
+    """
+    Keeps track of the vertices that can be appended to a partial path.
+
+    A vertex is ready if it was not visited yet and all of its predecessors were visited. Instead of checking
+    the predecessors of every candidate at every step, every vertex counts its unvisited predecessors and the
+    counters of the successors are decremented when a vertex is visited.
+
+    Only the constraints of the transitive reduction (see helper.precedence) are counted: once the non-implied
+    predecessors of a vertex are visited, all others are visited as well, so the ready sets are the same while
+    far fewer counters have to be updated on instances with many (implied) precedence constraints.
+    """
+
+    def __init__(self, instance):
+        """
+
+        :param instance: SOPInstance
+        """
+        graph = instance.precedence_graph
+        self.successors = graph.reduced_successors
+        self.remaining = graph.reduced_count.copy()  # number of unvisited predecessors
+        self.visited = np.zeros(instance.n, dtype=bool)
+        self.ready = self.remaining == 0
+
+    def visit(self, vertex):
+        """
+        Mark the vertex as visited and update the ready set.
+
+        :param vertex: vertex which gets appended to the path, has to be ready
+        """
+        self.visited[vertex] = True
+        self.ready[vertex] = False
+
+        successors = self.successors[vertex]
+        self.remaining[successors] -= 1
+        self.ready[successors[self.remaining[successors] == 0]] = True
@@ -0,0 +1,180 @@
+# compiled representation of a sop instance shared by all solution methods
+
+import numpy as np
+from helper.precedence import PrecedenceGraph, LiveArcs
+from helper.candidates import CandidateLists
+
+
+class SOPInstance:
+    """
+    Compiled form of the arcs matrix returned by the parser.
+
+    The arcs matrix mixes costs and precedence constraints (arcs[i, j] == -1 means that j must precede i).
+    Every solution method needs both informations separately, so they are extracted once here instead of
+    being re-derived from the raw matrix inside the inner loops of the methods.
+
+    Attributes:
+        n - number of vertices
+        start, end - first and last vertex of every feasible path
+        costs - (n, n) int32 matrix of arc costs (precedence entries are set to 0)
+        prec_bits - precedence matrix packed row wise into bits (n, ceil(n / 8)) uint8
+        precedence - (n, n) bool matrix, precedence[i, j] is True if j must precede i
+        pred_count - number of direct predecessors of every vertex
+        pred_ptr, pred_idx - predecessors of every vertex in compressed sparse row format
+        succ_ptr, succ_idx - successors of every vertex in compressed sparse row format
+        predecessors, successors - lists of arrays, predecessors[i] are the vertices that must precede i
+        precedence_graph - transitive closure and reduction of the precedence constraints (see helper.precedence)
+        live_arcs - arcs which can be part of a feasible path (see helper.precedence.LiveArcs)
+        candidates(k) - the k cheapest live successors / predecessors of every vertex (see helper.candidates)
+    """
+
+    # arrays which fully describe an instance (everything else is derived from them)
+    fields = ('costs', 'pred_ptr', 'pred_idx', 'succ_ptr', 'succ_idx', 'prec_bits')
+
+    # arrays of the derived indexes which are expensive to build (transitive closure and reduction, live arcs),
+    # stored with the instance by helper.cache and helper.shared
+    index_fields = tuple('graph_' + field for field in PrecedenceGraph.fields) \
+        + tuple('live_' + field for field in LiveArcs.fields)
+
+    def __init__(self, arcs, name=None):
+        """
+
+        :param arcs: weights of arcs of the graph (as returned by the parser) - 2 dim numpy array
+        :param name: optional name of the instance, e.g. 'ESC07'
+        """
+        arcs = np.asarray(arcs)
+        precedence = arcs == -1
+
+        costs = np.where(precedence, 0, arcs).astype(np.int32)
+
+        # predecessors: precedence[i, j] -> j precedes i, so row i lists the predecessors of i
+        pred_i, pred_j = np.nonzero(precedence)
+        pred_ptr = np.zeros(arcs.shape[0] + 1, dtype=np.int32)
+        np.cumsum(np.bincount(pred_i, minlength=arcs.shape[0]), out=pred_ptr[1:])
+
+        # successors: same pairs sorted by the preceding vertex
+        succ_j, succ_i = np.nonzero(precedence.T)
+        succ_ptr = np.zeros(arcs.shape[0] + 1, dtype=np.int32)
+        np.cumsum(np.bincount(succ_j, minlength=arcs.shape[0]), out=succ_ptr[1:])
+
+        self._setup(name, costs, pred_ptr, pred_j.astype(np.int32), succ_ptr, succ_i.astype(np.int32),
+                    np.packbits(precedence, axis=1))
+
+    @classmethod
+    def from_arrays(cls, name=None, **arrays):
+        """
+        Create an instance directly from its compiled arrays (see SOPInstance.fields) without
+        recomputing them, e.g. from a cache or shared memory. If the arrays of the indexes are given as well
+        (see SOPInstance.index_fields), the precedence graph and the live arcs are restored from them.
+
+        :param name: optional name of the instance
+        :param arrays: keyword arguments for every entry of SOPInstance.fields (and SOPInstance.index_fields)
+        :return: SOPInstance
+        """
+        instance = cls.__new__(cls)
+        instance._setup(name, *(arrays[field] for field in cls.fields))
+        if all(field in arrays for field in cls.index_fields):
+            instance._precedence_graph = PrecedenceGraph.from_arrays(
+                **{field: arrays['graph_' + field] for field in PrecedenceGraph.fields})
+            instance._live_arcs = LiveArcs.from_arrays(**{field: arrays['live_' + field] for field in LiveArcs.fields})
+        return instance
+
+    def _setup(self, name, costs, pred_ptr, pred_idx, succ_ptr, succ_idx, prec_bits):
+        # plain ndarray views of memory mapped arrays (same memory, but indexing np.memmap is slower)
+        costs, pred_ptr, pred_idx, succ_ptr, succ_idx, prec_bits = map(
+            np.asarray, (costs, pred_ptr, pred_idx, succ_ptr, succ_idx, prec_bits))
+        self.name = name
+        self.n = costs.shape[0]
+        self.start = 0
+        self.end = self.n - 1
+
+        self.costs = costs
+        self.pred_ptr = pred_ptr
+        self.pred_idx = pred_idx
+        self.succ_ptr = succ_ptr
+        self.succ_idx = succ_idx
+        self.prec_bits = prec_bits
+
+        self.pred_count = np.diff(pred_ptr).astype(np.int32)
+        self.predecessors = np.split(pred_idx, pred_ptr[1:-1])
+        self.successors = np.split(succ_idx, succ_ptr[1:-1])
+        self._precedence = None
+        self._precedence_graph = None
+        self._live_arcs = None
+        self._candidates = {}
+
+    @property
+    def precedence(self):
+        """
+        (n, n) bool matrix, precedence[i, j] is True if j must precede i (unpacked from prec_bits on first use)
+        """
+        if self._precedence is None:
+            self._precedence = np.unpackbits(self.prec_bits, axis=1, count=self.n).view(bool)
+        return self._precedence
+
+    @property
+    def precedence_graph(self):
+        """
+        PrecedenceGraph of the instance (computed on first use)
+        """
+        if self._precedence_graph is None:
+            self._precedence_graph = PrecedenceGraph(self)
+        return self._precedence_graph
+
+    @property
+    def live_arcs(self):
+        """
+        LiveArcs of the instance (computed on first use)
+        """
+        if self._live_arcs is None:
+            self._live_arcs = LiveArcs(self)
+        return self._live_arcs
+
+    def candidates(self, k):
+        """
+        :param k: length of the candidate lists
+        :return: CandidateLists of the instance (computed on first use for every k)
+        """
+        if k not in self._candidates:
+            self._candidates[k] = CandidateLists(self, k)
+        return self._candidates[k]
+
+    def arrays(self, indexes=False):
+        """
+        :param indexes: include the arrays of the precedence graph and the live arcs (computed if necessary)
+        :return: dict of the arrays that fully describe the instance (see SOPInstance.fields and index_fields)
+        """
+        arrays = {field: getattr(self, field) for field in self.fields}
+        if indexes:
+            arrays.update(('graph_' + field, array) for field, array in self.precedence_graph.arrays().items())
+            arrays.update(('live_' + field, array) for field, array in self.live_arcs.arrays().items())
+        return arrays
+
+    def must_precede(self, j, i):
+        """
+        :return: True if vertex j has to be visited before vertex i (direct precedence constraint)
+        """
+        return bool(self.prec_bits[i, j >> 3] & (0x80 >> (j & 7)))
+
+    def path_cost(self, path):
+        """
+        :param path: sequence of vertices
+        :return: sum of the costs of the arcs along the path
+        """
+        path = np.asarray(path)
+        return int(self.costs[path[:-1], path[1:]].sum(dtype=np.int64))
+
+    def __repr__(self):
+        return "SOPInstance(name={0!r}, n={1}, precedences={2})".format(self.name, self.n, self.pred_idx.size)
+
+
+def as_instance(arcs):
+    """
+    Compile the arcs matrix to a SOPInstance unless it already is one.
+
+    :param arcs: arcs matrix as returned by the parser or SOPInstance
+    :return: SOPInstance
+    """
+    if isinstance(arcs, SOPInstance):
+        return arcs
+    return SOPInstance(arcs)
@@ -0,0 +1,161 @@
+# evaluation of insertion moves on a feasible path without recomputing the cost of the whole path
+
+import numpy as np
+
+
+class Tour:
+    """
+    Feasible path of an instance together with the position of every vertex.
+
+    An insertion move (i, j) removes the vertex at position i and inserts it again such that it ends up at
+    position j, the vertices in between shift by one position (as the moves of DPSO.operations.op_perm_sum_velocity).
+    Only three arcs are removed and three arcs are added, so the cost delta of a move is computed in O(1).
+    The path stays feasible if the vertex does not pass one of its successors (moving forward) or predecessors
+    (moving backward). In a feasible path the closest of them is always a neighbour in the transitive reduction,
+    so checking a move costs O(deg) of the reduction. Positions outside the range of positions the vertex can
+    have in any feasible path (see helper.precedence.PrecedenceGraph.position_feasible) are rejected in O(1) first.
+
+    An exchange move (h, i, j) swaps the adjacent segments path[h + 1..i] and path[i + 1..j] without reversing them
+    (the path preserving 3-exchange of the SOP-3-exchange local search), its cost delta is O(1) as well. It keeps
+    the path feasible if no vertex of the first segment is a predecessor (in the transitive reduction) of a vertex
+    of the second segment. Swapping two single vertices is checked in O(1) with the transitive closure.
+
+    Start and end vertex (positions 0 and n - 1) are never moved.
+
+    Attributes:
+        path - (n,) int array, vertices in the order of the path
+        position - (n,) int array, position[v] is the index of vertex v in path
+        cost - cost of the path
+    """
+
+    def __init__(self, instance, path):
+        """
+
+        :param instance: SOPInstance
+        :param path: feasible path (sequence of all vertices from start to end vertex)
+        """
+        self.instance = instance
+        self.costs = instance.costs
+        self.n = instance.n
+
+        self.graph = graph = instance.precedence_graph
+        self.predecessors = [graph.reduced_predecessors(vertex) for vertex in range(self.n)]
+        self.successors = graph.reduced_successors
+
+        self.path = np.array(path, dtype=np.int32)
+        self.position = np.empty(self.n, dtype=np.int32)
+        self.position[self.path] = np.arange(self.n, dtype=np.int32)
+        self.cost = instance.path_cost(self.path)
+
+    def insertion_delta(self, i, j):
+        """
+        :param i: position of the vertex to move (1 <= i <= n - 2)
+        :param j: position of the vertex after the move (1 <= j <= n - 2)
+        :return: change of the cost of the path if the vertex at position i is moved to position j
+        """
+        if i == j:
+            return 0
+        path, costs = self.path, self.costs
+        a, vertex, b = path[i - 1], path[i], path[i + 1]
+        # arcs around the vertex are replaced by (a, b), the vertex goes between c and d
+        c, d = (path[j], path[j + 1]) if j > i else (path[j - 1], path[j])
+        return int(costs[a, b] + costs[c, vertex] + costs[vertex, d]
+                   - costs[a, vertex] - costs[vertex, b] - costs[c, d])
+
+    def insertion_deltas(self, i):
+        """
+        Cost deltas of all moves of the vertex at position i in one vectorized step.
+
+        :param i: position of the vertex to move (1 <= i <= n - 2)
+        :return: (n,) int64 array, entry j is insertion_delta(i, j) for 1 <= j <= n - 2 and 0 otherwise
+        """
+        path, costs = self.path, self.costs
+        vertex = path[i]
+        removal = int(costs[path[i - 1], path[i + 1]]) - int(costs[path[i - 1], vertex]) \
+            - int(costs[vertex, path[i + 1]])
+
+        # cost of inserting the vertex between path[k] and path[k + 1] for every k (int64, only the gathered arcs)
+        between = costs[path[:-1], vertex].astype(np.int64) + costs[vertex, path[1:]] - costs[path[:-1], path[1:]]
+
+        deltas = np.zeros(self.n, dtype=np.int64)
+        # forward: between path[j] and path[j + 1], backward: between path[j - 1] and path[j]
+        deltas[i + 1:self.n - 1] = removal + between[i + 1:self.n - 1]
+        deltas[1:i] = removal + between[:i - 1]
+        return deltas
+
+    def feasible_range(self, i):
+        """
+        :param i: position of a vertex (1 <= i <= n - 2)
+        :return: lowest and highest position the vertex can be moved to without violating a precedence constraint
+        """
+        vertex = self.path[i]
+        predecessors = self.position[self.predecessors[vertex]]
+        successors = self.position[self.successors[vertex]]
+        low = int(predecessors.max()) + 1 if predecessors.size else 1
+        high = int(successors.min()) - 1 if successors.size else self.n - 2
+        return max(low, 1), min(high, self.n - 2)
+
+    def insertion_feasible(self, i, j):
+        """
+        :return: True if moving the vertex at position i to position j keeps the path feasible
+        """
+        if not self.graph.position_feasible(self.path[i], j):
+            return False
+        low, high = self.feasible_range(i)
+        return low <= j <= high
+
+    def insert(self, i, j):
+        """
+        Move the vertex at position i to position j and update positions and cost.
+
+        :return: cost delta of the move
+        """
+        delta = self.insertion_delta(i, j)
+        vertex = self.path[i]
+        if j > i:
+            self.path[i:j] = self.path[i + 1:j + 1]
+        elif j < i:
+            self.path[j + 1:i + 1] = self.path[j:i]
+        self.path[j] = vertex
+
+        low, high = min(i, j), max(i, j)
+        self.position[self.path[low:high + 1]] = np.arange(low, high + 1, dtype=np.int32)
+        self.cost += delta
+        return delta
+
+    def exchange_delta(self, h, i, j):
+        """
+        :param h: position before the first segment (0 <= h < i)
+        :param i: last position of the first segment (i < j)
+        :param j: last position of the second segment (j <= n - 2)
+        :return: change of the cost of the path if the segments path[h + 1..i] and path[i + 1..j] are exchanged
+        """
+        path, costs = self.path, self.costs
+        a, b, c, d, e, f = path[h], path[h + 1], path[i], path[i + 1], path[j], path[j + 1]
+        # (a, b), (c, d), (e, f) are replaced by (a, d), (e, b), (c, f)
+        return int(costs[a, d] + costs[e, b] + costs[c, f] - costs[a, b] - costs[c, d] - costs[e, f])
+
+    def exchange_feasible(self, h, i, j):
+        """
+        :return: True if exchanging the segments path[h + 1..i] and path[i + 1..j] keeps the path feasible
+        """
+        if i - h == 1 and j - i == 1:
+            return self.graph.can_follow(self.path[j], self.path[i])
+        # only the shorter segment is checked: successors of the left one in the right one or vice versa
+        if i - h <= j - i:
+            successors = self.position[np.concatenate([self.successors[vertex] for vertex in self.path[h + 1:i + 1]])]
+            return not ((successors > i) & (successors <= j)).any()
+        predecessors = self.position[np.concatenate([self.predecessors[vertex] for vertex in self.path[i + 1:j + 1]])]
+        return not ((predecessors > h) & (predecessors <= i)).any()
+
+    def exchange(self, h, i, j):
+        """
+        Exchange the segments path[h + 1..i] and path[i + 1..j] and update positions and cost.
+
+        :return: cost delta of the move
+        """
+        delta = self.exchange_delta(h, i, j)
+        self.path[h + 1:j + 1] = np.concatenate((self.path[i + 1:j + 1], self.path[h + 1:i + 1]))
+        self.position[self.path[h + 1:j + 1]] = np.arange(h + 1, j + 1, dtype=np.int32)
+        self.cost += delta
+        return delta
@@ -1,5 +1,6 @@
-# sop (and soon sol) to numpy array parser
+# sop and sol to numpy array parser
 
+import math
 import numpy as np
 
 def filenames(relative_paths=None):
@@ -51,15 +52,60 @@ def filenames(relative_paths=None):
 
     return names_sop, names_sol
 
-def parser(data_path, show_comments=False):
+def smallest_int_type(values):
+    """
+
+    :param values: numpy array of integers
+    :return: smallest signed integer dtype which can hold all values
+    """
+    low, high = (int(values.min()), int(values.max())) if values.size > 0 else (0, 0)
+    for dtype in (np.int8, np.int16, np.int32):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def parse_sop(read_data):
+    """
+
+    :param read_data: content of a .sop file
+    :return: dimension and the values of the matrix as 1 dim numpy array
+
+    Works with the format of the course_benchmark_instance.zip file (dimension in the first line followed by
+    the rows of the matrix) and with TSPLIB files (header lines, EDGE_WEIGHT_SECTION with an optional dimension
+    line before the matrix, EOF). Values can be separated by any whitespace.
+    """
+
+    # TSPLIB: only the edge weight section contains numbers
+    if 'EDGE_WEIGHT_SECTION' in read_data:
+        read_data = read_data.split('EDGE_WEIGHT_SECTION', 1)[1].split('EOF', 1)[0]
+
+    # tokenize the whole file in one pass (text mode, any whitespace separates values)
+    values = np.fromstring(read_data, dtype=np.int64, sep=' ')
+
+    # the matrix is either preceded by its dimension or not
+    dimension = math.isqrt(values.size)
+    if dimension * dimension != values.size:
+        dimension = int(values[0]) if values.size > 0 else 0
+        values = values[1:]
+
+    if dimension * dimension != values.size:
+        raise ValueError("Expected a {0}x{0} matrix but found {1} values.".format(dimension, values.size))
+
+    return dimension, values
+
+
+def parser(data_path, show_comments=False, dtype=None):
     """
 
     :param data: - string -  data path e.g. 'Data/course_benchmark_instances/ESC07.sop'
+    :param dtype: - numpy dtype - type of the returned array; by default the smallest integer type
+                  which can hold all values (e.g. int16 for the R.* instances, int32 for ESC*)
     :return: as numpy array parsed data
 
-    parser method parses sop !!and sol!!  files to a 2 or 1 dimensional numpy array
+    parser method parses sop and sol files to a 2 or 1 dimensional numpy array
 
-    NOTE: only .sop files as given in the course_benchmark_instance.zip file will work
+    NOTE: .sop files as given in the course_benchmark_instance.zip file and TSPLIB .sop files will work
     """
 
     # get filetype
@@ -78,22 +124,9 @@ def parser(data_path, show_comments=False):
         if show_comments:
             print("Parsing {0} file".format(file_type))
 
-        # split rows (first row which contains dimension information will still be in first
-        # entry of the list)
-        row_strings = read_data.split('\t\n')
-
-        # separate dimension and first row and save / replace them
-        dimension, row_strings[0] = row_strings[0].split('\n')
-
-        # convert dimension to integer
-        dimension = int(dimension)
-
-        # create empty np array with matching output size
-        output = np.zeros(shape=(dimension, dimension))
-
-        # fill output array with values
-        for i in range(dimension):
-            output[i, :] = np.fromstring(row_strings[i], dtype=int, sep='\t')
+        dimension, values = parse_sop(read_data)
+        output = values.reshape(dimension, dimension)
+        output = output.astype(smallest_int_type(values) if dtype is None else dtype)
 
         # just some string output
         if show_comments:
@@ -105,13 +138,10 @@ def parser(data_path, show_comments=False):
         if show_comments:
             print("Parsing {0} file \n".format(file_type))
 
-        # get rid of line break
-        read_data = read_data[:-1]
-
         # values to np array
-        values = np.fromstring(read_data, dtype=int, sep=' ')
+        values = np.fromstring(read_data, dtype=np.int64, sep=' ')
 
-        return values
+        return values.astype(smallest_int_type(values) if dtype is None else dtype)
 
 
 
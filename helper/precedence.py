@@ -0,0 +1,213 @@
+# transitive closure and reduction of the precedence constraints of a sop instance
+
+import numpy as np
+
+
+def topological_order(instance):
+    """
+
+    :param instance: SOPInstance
+    :return: vertices in an order in which every vertex comes after all of its predecessors
+    """
+    remaining = instance.pred_count.copy()
+    order = list(np.flatnonzero(remaining == 0))
+
+    for vertex in order:  # the list grows while iterating
+        successors = instance.successors[vertex]
+        remaining[successors] -= 1
+        order.extend(successors[remaining[successors] == 0])
+
+    if len(order) != instance.n:
+        raise ValueError("The precedence constraints contain a cycle.")
+
+    return np.array(order, dtype=np.int32)
+
+
+class PrecedenceGraph:
+    """
+    Precomputed index of the precedence graph of an instance.
+
+    The direct precedence constraints of the instance imply further ones (if i precedes j and j precedes k,
+    i precedes k). The closure answers "does i have to be visited before j" with one bit lookup.
+
+    Attributes:
+        order - topological order of the vertices
+        ancestors - (n, ceil(n / 8)) uint8, bit j of row i is set if j has to precede i (transitively)
+        descendants - (n, ceil(n / 8)) uint8, bit j of row i is set if i has to precede j (transitively)
+        ancestor_count, descendant_count - number of set bits in the rows of ancestors / descendants
+        earliest, latest - range of positions every vertex can have in a feasible path
+        reduced_ptr, reduced_idx - predecessors of the transitive reduction in compressed sparse row format,
+                                   i.e. the direct predecessors which are not implied by other ones
+        reduced_count - number of predecessors of every vertex in the transitive reduction
+        reduced_successors - list of arrays, successors of every vertex in the transitive reduction
+    """
+
+    # arrays the index is restored from (e.g. by helper.cache), everything else is derived from them in O(n^2)
+    fields = ('order', 'ancestors', 'descendants', 'reduced_ptr', 'reduced_idx')
+
+    def __init__(self, instance):
+        """
+
+        :param instance: SOPInstance
+        """
+        n = instance.n
+        self.n = n
+        self.order = topological_order(instance)
+
+        # in topological order the ancestors of all predecessors are known when a vertex is reached
+        self.ancestors = np.zeros_like(instance.prec_bits)
+        reduced = [None] * n
+        for vertex in self.order:
+            predecessors = instance.predecessors[vertex]
+            if predecessors.size == 0:
+                reduced[vertex] = predecessors
+                continue
+
+            # vertices which precede some predecessor; a direct predecessor among them is implied
+            implied = np.bitwise_or.reduce(self.ancestors[predecessors], axis=0)
+            self.ancestors[vertex] = implied | instance.prec_bits[vertex]
+            reduced[vertex] = predecessors[(implied[predecessors >> 3] & (0x80 >> (predecessors & 7))) == 0]
+
+        ancestor_matrix = np.unpackbits(self.ancestors, axis=1, count=n).view(bool)
+        self.descendants = np.packbits(ancestor_matrix.T, axis=1)
+
+        self.reduced_ptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum([len(predecessors) for predecessors in reduced], out=self.reduced_ptr[1:])
+        self.reduced_idx = np.concatenate(reduced).astype(np.int32)
+        self._derive()
+
+    @classmethod
+    def from_arrays(cls, **arrays):
+        """
+        Restore the index from its arrays (see PrecedenceGraph.fields) without recomputing the closure.
+
+        :param arrays: keyword arguments for every entry of PrecedenceGraph.fields
+        :return: PrecedenceGraph
+        """
+        graph = cls.__new__(cls)
+        for field in cls.fields:
+            setattr(graph, field, np.asarray(arrays[field]))
+        graph.n = graph.order.size
+        graph._derive()
+        return graph
+
+    def arrays(self):
+        """
+        :return: dict of the arrays the index can be restored from (see PrecedenceGraph.fields)
+        """
+        return {field: getattr(self, field) for field in self.fields}
+
+    def _derive(self):
+        n = self.n
+        self.ancestor_count = np.unpackbits(self.ancestors, axis=1, count=n).sum(axis=1, dtype=np.int32)
+        self.descendant_count = np.unpackbits(self.descendants, axis=1, count=n).sum(axis=1, dtype=np.int32)
+
+        # all ancestors have to be visited before and all descendants after a vertex
+        self.earliest = self.ancestor_count
+        self.latest = (n - 1 - self.descendant_count).astype(np.int32)
+
+        self.reduced_count = np.diff(self.reduced_ptr).astype(np.int32)
+
+        # successors of the reduction: same pairs sorted by the preceding vertex
+        constrained = np.repeat(np.arange(n, dtype=np.int32), self.reduced_count)[np.argsort(self.reduced_idx,
+                                                                                             kind='stable')]
+        self.reduced_successors = np.split(constrained, np.cumsum(np.bincount(self.reduced_idx, minlength=n))[:-1])
+
+    def precedes(self, i, j):
+        """
+        :return: True if vertex i has to be visited before vertex j (directly or transitively implied)
+        """
+        return bool(self.ancestors[j, i >> 3] & (0x80 >> (i & 7)))
+
+    def can_follow(self, i, j):
+        """
+        :return: True if vertex j may be visited (anywhere) after vertex i
+        """
+        return i != j and not self.precedes(j, i)
+
+    def position_feasible(self, vertex, position):
+        """
+        Necessary condition for inserting a vertex at a position of a path: there have to be enough positions
+        before it for its ancestors and after it for its descendants.
+
+        :return: True if the position is within the feasible range of the vertex
+        """
+        return self.earliest[vertex] <= position <= self.latest[vertex]
+
+    def reduced_predecessors(self, vertex):
+        """
+        :return: direct predecessors of the vertex which are not implied by other precedence constraints
+        """
+        return self.reduced_idx[self.reduced_ptr[vertex]:self.reduced_ptr[vertex + 1]]
+
+
+class LiveArcs:
+    """
+    Arcs which can be part of a feasible path.
+
+    An arc (i, j) can never be used if
+        - j has to precede i (directly or transitively),
+        - some vertex k has to be visited after i and before j,
+        - it starts at the end vertex, ends at the start vertex or is a loop,
+        - its weight is infinite (>= 500000, as in helper.verification).
+
+    Attributes:
+        mask - (n, n) bool matrix, mask[i, j] is True if the arc (i, j) is live
+        ptr, idx - live successors of every vertex in compressed sparse row format
+        successors - list of arrays, successors[i] are the vertices which can directly follow i
+        removed - number of arcs (i, j) with i != j which were eliminated
+    """
+
+    # arrays the live arcs are restored from (e.g. by helper.cache)
+    fields = ('mask', 'ptr', 'idx')
+
+    def __init__(self, instance):
+        """
+
+        :param instance: SOPInstance
+        """
+        n = instance.n
+        graph = instance.precedence_graph
+        ancestors = np.unpackbits(graph.ancestors, axis=1, count=n).view(bool)
+        descendants = np.unpackbits(graph.descendants, axis=1, count=n).view(bool)
+
+        # between[i, j]: some vertex has to be visited after i and before j
+        between = (descendants.astype(np.float32) @ ancestors.T.astype(np.float32)) > 0
+
+        self.mask = ~between & ~ancestors & (instance.costs < 500000)
+        np.fill_diagonal(self.mask, False)
+        self.mask[instance.end, :] = False
+        self.mask[:, instance.start] = False
+
+        self.ptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(self.mask.sum(axis=1), out=self.ptr[1:])
+        self.idx = np.nonzero(self.mask)[1].astype(np.int32)
+        self._derive()
+
+    @classmethod
+    def from_arrays(cls, **arrays):
+        """
+        Restore the live arcs from their arrays (see LiveArcs.fields) without recomputing them.
+
+        :param arrays: keyword arguments for every entry of LiveArcs.fields
+        :return: LiveArcs
+        """
+        live_arcs = cls.__new__(cls)
+        for field in cls.fields:
+            setattr(live_arcs, field, np.asarray(arrays[field]))
+        live_arcs._derive()
+        return live_arcs
+
+    def arrays(self):
+        """
+        :return: dict of the arrays the live arcs can be restored from (see LiveArcs.fields)
+        """
+        return {field: getattr(self, field) for field in self.fields}
+
+    def _derive(self):
+        n = self.mask.shape[0]
+        self.successors = np.split(self.idx, self.ptr[1:-1])
+        self.removed = n * (n - 1) - self.idx.size
+
+    def __repr__(self):
+        return "LiveArcs(live={0}, removed={1})".format(self.idx.size, self.removed)
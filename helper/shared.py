@@ -0,0 +1,104 @@
+# sharing numpy arrays (e.g. a compiled instance) between processes without pickling them
+
+import numpy as np
+from multiprocessing import shared_memory
+from helper.instance import SOPInstance
+
+# shared memory blocks this process is attached to (they have to stay open as long as the arrays are used)
+_attached_blocks = []
+
+# state of a worker process of a multiprocessing Pool (see initialize_worker)
+worker_state = {}
+
+
+class SharedArrays:
+    """
+    Copies numpy arrays into shared memory blocks.
+
+    Only the spec (names of the blocks, shapes and dtypes) has to be sent to other processes, which get
+    numpy arrays backed by the same memory through attach_arrays(spec).
+    The creating process owns the blocks and has to close them (or use the object as context manager).
+    """
+
+    def __init__(self, arrays):
+        """
+
+        :param arrays: dict of numpy arrays
+        """
+        self.blocks = []
+        self.arrays = {}
+        self.spec = {}
+
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared[...] = array
+
+            self.blocks.append(block)
+            self.arrays[key] = shared
+            self.spec[key] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        """
+        Release and remove the shared memory blocks. Arrays handed out before are not valid any more.
+        """
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def attach_arrays(spec):
+    """
+    Attach to shared memory blocks created by SharedArrays in another process.
+
+    :param spec: SharedArrays.spec
+    :return: dict of numpy arrays backed by the shared memory
+    """
+    arrays = {}
+    for key, (name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=name)
+        _attached_blocks.append(block)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return arrays
+
+
+def share_instance(instance):
+    """
+    :param instance: SOPInstance
+    :return: SharedArrays containing the arrays of the instance and of its indexes (see attach_instance)
+    """
+    return SharedArrays(instance.arrays(indexes=True))
+
+
+def attach_instance(spec, name=None):
+    """
+    :param spec: SharedArrays.spec of a shared instance (see share_instance)
+    :param name: optional name of the instance
+    :return: SOPInstance backed by the shared memory
+    """
+    return SOPInstance.from_arrays(name, **attach_arrays(spec))
+
+
+def initialize_worker(instance_spec, shared=None, values=None):
+    """
+    Initializer of multiprocessing Pools: attaches the worker process to the shared instance
+    (worker_state['instance']) and to further shared arrays (worker_state[key] = attach_arrays(shared[key])) and
+    stores further values (e.g. a multiprocessing.Value) in worker_state.
+
+    :param instance_spec: SharedArrays.spec of the shared instance (see share_instance)
+    :param shared: optional dict of SharedArrays.spec
+    :param values: optional dict of values
+    """
+    worker_state['instance'] = attach_instance(instance_spec)
+    for key, spec in (shared or {}).items():
+        worker_state[key] = attach_arrays(spec)
+    worker_state.update(values or {})
@@ -1,49 +1,102 @@
 # verification of given solutions
+import numpy as np
 from helper.parser import parser, filenames
+from helper.instance import as_instance
+from helper.cache import load_instance
 
 
-def check_solution(arcs, solution):
+def verify_solutions(arcs, solutions):
     """
 
-    :param arcs: weights of arcs of the graph - 2 dim numpy array
-    :param solution: solution vector - 1 dim numpy array
-    :return: value of the solution; if -1 gets returned, solution is not valid
+    :param arcs: weights of arcs of the graph - 2 dim numpy array or SOPInstance
+    :param solutions: solution vectors - 2 dim numpy array (one solution per row)
+    :return: tuple of the values of the solutions (-1 for invalid solutions), bool array whether the solutions
+             are valid and a list with the reason why each solution is not valid (None for valid solutions)
 
-    Method to check whether a solution is valid in terms of length, precedence constraints and permutation property.
-    Returns the value of the Solution.
+    Method to check many solutions at once in terms of length, permutation property, arc weights and precedence
+    constraints. The positions of the vertices are computed once per solution, then all precedence constraints
+    are checked by a single comparison, i.e. O(n + number of precedence constraints) per solution.
     """
 
-    value = 0
+    instance = as_instance(arcs)
+    solutions = np.atleast_2d(solutions)
+    m, length = solutions.shape
+    n = instance.n
 
     # check if shapes coincide
-    if solution.shape[0] != arcs.shape[0]:
-        return -1
+    if length != n:
+        return (np.full(m, -1, dtype=np.int64), np.zeros(m, dtype=bool),
+                ["solution has {0} vertices instead of {1}".format(length, n)] * m)
 
     # check if values are in valid range
-    if solution.max() >= solution.shape[0]:
-        return -1
+    in_range = ((solutions >= 0) & (solutions < n)).all(axis=1)
+    vertices = np.where(in_range[:, np.newaxis], solutions, 0)
 
     # check that all solution is a permutation (no value is allowed twice)
-    if len(set(solution)) != solution.shape[0]:
-        return -1
+    permutation = in_range & (np.sort(vertices, axis=1) == np.arange(n)).all(axis=1)
+
+    # position of every vertex in every solution
+    positions = np.zeros((m, n), dtype=np.int64)
+    np.put_along_axis(positions, vertices, np.broadcast_to(np.arange(n), (m, n)), axis=1)
+
+    # check if arc weights are valid values
+    arc_weights = instance.costs[vertices[:, :-1], vertices[:, 1:]].astype(np.int64)
+    valid_arcs = (arc_weights < 500000).all(axis=1)
+
+    # check precedence constraints: pred_idx[k] has to precede constrained[k]
+    constrained = np.repeat(np.arange(n), instance.pred_count)
+    satisfied = positions[:, instance.pred_idx] < positions[:, constrained]
+    precedences = satisfied.all(axis=1)
+
+    valid = permutation & valid_arcs & precedences
+    values = np.where(valid, arc_weights.sum(axis=1), -1)
+
+    errors = []
+    for i in range(m):
+        if valid[i]:
+            errors.append(None)
+        elif not in_range[i]:
+            vertex = solutions[i][(solutions[i] < 0) | (solutions[i] >= n)][0]
+            errors.append("vertex {0} is out of range".format(vertex))
+        elif not permutation[i]:
+            counts = np.bincount(vertices[i], minlength=n)
+            errors.append("vertex {0} is visited more than once".format(np.flatnonzero(counts > 1)[0]))
+        elif not precedences[i]:
+            k = np.flatnonzero(~satisfied[i])[0]
+            errors.append("vertex {0} is visited before its predecessor {1}".format(constrained[k],
+                                                                                    instance.pred_idx[k]))
+        else:
+            k = np.flatnonzero(arc_weights[i] >= 500000)[0]
+            errors.append("arc ({0}, {1}) has infinite weight".format(vertices[i, k], vertices[i, k + 1]))
+
+    return values, valid, errors
+
+
+def verify_solution(arcs, solution):
+    """
 
-    for i in range(solution.shape[0]-1):  # cycle through solution and check constraints
-        arc_weight = arcs[solution[i], solution[i+1]]
+    :param arcs: weights of arcs of the graph - 2 dim numpy array or SOPInstance
+    :param solution: solution vector - 1 dim numpy array
+    :return: tuple of the value of the solution (-1 if it is not valid) and the reason why the solution is not
+             valid (None if it is valid)
+    """
 
-        # check if arc_weight is valid value
-        if arc_weight == -1 or arc_weight >= 500000:
-            return -1
+    values, _, errors = verify_solutions(arcs, np.asarray(solution)[np.newaxis, :])
+    return int(values[0]), errors[0]
 
-        for j in range(arcs.shape[0]):
-            # check precedence constraints
-            if arcs[solution[i], j] == -1:  # check row i for constraints
-                if j not in solution[:i]:
-                    # if constraint is not satisfied in solution
-                    return -1
 
-        value += arc_weight
+def check_solution(arcs, solution):
+    """
+
+    :param arcs: weights of arcs of the graph - 2 dim numpy array or SOPInstance
+    :param solution: solution vector - 1 dim numpy array
+    :return: value of the solution; if -1 gets returned, solution is not valid
+
+    Method to check whether a solution is valid in terms of length, precedence constraints and permutation property.
+    Returns the value of the Solution. Use verify_solution to get the reason why a solution is not valid.
+    """
 
-    return value
+    return verify_solution(arcs, solution)[0]
 
 if __name__ == "__main__":
 
@@ -59,10 +112,12 @@ if __name__ == "__main__":
 
     # fill arrays
     for i in range(len(sop_files)):
-        arcs = parser(sop_files[i], True)
+        arcs = load_instance(sop_files[i], True)
         solution = parser(sol_files[i], True)
         instances += [(arcs, solution)]
-        value = check_solution(arcs, solution)
+        value, error = verify_solution(arcs, solution)
+        if error is not None:
+            print("The solution is not valid: " + error)
         print("The solution value is: " + str(int(value)) + "\n")
 
     print("")
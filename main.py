@@ -3,28 +3,38 @@
 ### used methods can be found in the methods folder; helpers in the helpers folder
 
 # imports
+import multiprocessing as mp
+import time
+from functools import partial
 from helper.parser import parser, filenames
+from helper.cache import load_instance
 
 
 if __name__ == "__main__":
     # import methods
     from methods.exact_method import *
-    from methods.greedy_method import greedy, best_greedy_randomized
+    from methods.greedy_method import greedy
+    from methods.greedy_randomized import best_greedy_randomized
     from methods.particleSwarmOpt_method import pso
+    from methods.aco.colony import ant_colony_system
 
     # specify used methods
     solution_methods = {
         'exact_method': True,
-        'pso': False,  # TODO: implement
+        'pso': False,
         'greedy': True,
         'best_greedy_randomized': True,
+        'aco': True,
     }
 
+    time_budget = 60  # seconds per instance for the metaheuristics
+
     solvers = {  # the actual functions for the methods
-        'exact_method': gurobi_problem,
-        'pso': pso,
+        'exact_method': exact_problem,
+        'pso': partial(pso, time_budget=time_budget),
         'greedy': greedy,
-        'best_greedy_randomized': best_greedy_randomized,
+        'best_greedy_randomized': partial(best_greedy_randomized, time_budget=time_budget),
+        'aco': partial(ant_colony_system, time_budget=time_budget, colonies=mp.cpu_count()),
     }
 
     # directory paths
@@ -45,12 +55,17 @@ if __name__ == "__main__":
         solution = parser(sol_files[i], True)
         if solution.size > filter_size and filter == 'easy':  # filter out 'big' instances
             continue
-        arcs = parser(sop_files[i], True)
-        instances += [(arcs, solution)]
+        # compiled instance from the binary cache, all methods work on the same SOPInstance
+        instance = load_instance(sop_files[i], True)
+        instances += [(instance, solution)]
 
     for instance in instances:  # for each instance
         for method in solution_methods:  # go through all methods
             if solution_methods[method]:  # and use the specified ones
-                solvers[method](instance[0])  # to solve the problem
+                time_start = time.perf_counter()
+                result = solvers[method](instance[0])  # to solve the problem
+                if isinstance(result, tuple):  # (path, cost, ...)
+                    print('{}: {} cost {} ({:.1f}s)'.format(method, instance[0].name, result[1],
+                                                            time.perf_counter() - time_start))
 
     print("DONE")
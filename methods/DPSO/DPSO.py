@@ -1,11 +1,78 @@
 import math
-import random
-from random import uniform as U
+import time
 import numpy as np
 import multiprocessing as mp
+from contextlib import ExitStack
 from typing import List
 from .operations import op_perm_sub_perm, op_scalar_mul_velocity, op_perm_sum_velocity, op_perm_fix
-from copy import deepcopy
+from .swarm import swarm_costs, swarm_perm_sub_perm, swarm_scalar_mul_velocity, swarm_perm_sum_velocity, \
+    swarm_perm_fix, stack_velocities, unstack_velocities
+from helper.instance import as_instance
+from helper.shared import share_instance, attach_instance, initialize_worker, worker_state
+from .checkpoint import rng_state, rng_from_state, write_checkpoint, read_checkpoint
+
+def _create_single_particle(params):
+    """
+    This function is creating a single particle inside a process in a multiprocessing Pool
+    :param params: a pair containing: rng, lower_bound_velocity_size, upper_bound_velocity_size, set_nodes, set_displacement, seed_perm
+    :return: a pair containing: velocity of particle, fixed particle, cost of particle
+    """
+    rng, lower_bound_velocity_size, upper_bound_velocity_size, set_nodes, set_displacement, seed_perm = params
+    instance = worker_state['instance']
+
+    # generate no. of insertion moves for current velocity
+    velocity_size = rng.integers(lower_bound_velocity_size, upper_bound_velocity_size, endpoint=True)
+
+    nodes = rng.choice(set_nodes, velocity_size, replace=False)  # generate nodes
+    displacements = rng.choice(set_displacement, velocity_size, replace=False)
+    velocity = np.column_stack((nodes, displacements))
+
+    unfixed_particle = op_perm_sum_velocity(x=seed_perm, v=velocity)
+    fixed_particle = op_perm_fix(x=np.concatenate(([instance.start], unfixed_particle, [instance.end])),
+                                 predecessors=instance.predecessors)
+    cost = instance.path_cost(np.concatenate(([instance.start], fixed_particle, [instance.end])))
+
+    # very important: have velocities that transform seed permutation into fixed one
+    velocity = op_perm_sub_perm(fixed_particle, seed_perm)
+
+    return velocity, fixed_particle, cost
+
+
+def _island_worker(connection, instance_spec, name, coefficients, particles, velocities, pbest, rng, gbest=None):
+    """
+    Long-lived worker process of the island engine, owns a part of the swarm (an island) for the whole optimization.
+    Every message (iterations, immigrant) lets the island take the immigrant (best particle of another island or None)
+    and run iterations steps of the vectorized engine, the reply is the best particle of the island and its cost.
+    The message 'state' is answered with the state of the island (particles, velocities, pbest, gbest, state of
+    the random generator), the message None ends the worker.
+    :param connection: end of a multiprocessing Pipe
+    :param instance_spec: SharedArrays.spec of the shared instance
+    :param name: name of the instance
+    :param coefficients: coef_inertia, coef_personal, coef_social
+    :param particles: particles of the island
+    :param velocities: velocities of the island
+    :param pbest: personal bests of the island
+    :param rng: random generator of the island
+    :param gbest: global best of the island (default: best personal best)
+    """
+    island = DPSO.island(attach_instance(instance_spec, name), coefficients, particles, velocities, pbest, rng, gbest)
+    swarm = island._stack_swarm()
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        if isinstance(message, str): # 'state'
+            island._unstack_swarm(*swarm)
+            connection.send((island.particles, island.velocities, island.pbest, island.gbest, rng_state(island.rng)))
+            continue
+        iterations, immigrant = message
+        if immigrant is not None:
+            island._immigrate(immigrant, *swarm)
+        for _ in range(iterations):
+            swarm = island._vectorized_step(*swarm)
+        connection.send((island.gbest, island.cost(island.gbest)))
+    connection.close()
+
 
 class DPSO:
     def __init__(self,
@@ -14,7 +81,8 @@ class DPSO:
                  coef_personal : float,
                  coef_social : float,
                  particle_size : int,
-                 weights_matrix : List[List]) -> None:
+                 weights_matrix : List[List],
+                 seed : int = None) -> None:
         """
         Initializes a new instance of Discrete Particle Swarm Optimization
         :param pop_size: number of particles in population
@@ -23,6 +91,17 @@ class DPSO:
         :param coef_social: coefficient of distance from current perm to global best perm
         :param particle_size: the size of one particle
         :param weights_matrix: matrix of edge weights and precedence constraints (Wij = -1 => j must precede i)
+                               or the corresponding SOPInstance
+        :param seed: seed of the random generator self.rng (every particle creation and update step gets its own
+                     random stream spawned from it)
+        """
+        self._setup(pop_size, coef_inertia, coef_personal, coef_social, particle_size, as_instance(weights_matrix),
+                    np.random.default_rng(seed))
+        self._initialize()
+
+    def _setup(self, pop_size, coef_inertia, coef_personal, coef_social, particle_size, instance, rng) -> None:
+        """
+        Sets the parameters and an empty swarm (see __init__)
         """
         self.file_name = None
         self.pop_size = pop_size
@@ -30,19 +109,26 @@ class DPSO:
         self.coef_personal = coef_personal
         self.coef_social = coef_social
         self.particle_size = particle_size
-        self.weights_matrix = weights_matrix
+        self.instance = instance
+        self.weights_matrix = self.instance.costs
+        self.rng = rng
+
+        self.iteration = 0 # number of iterations the swarm did so far
+        self.stagnation = 0 # number of iterations since the last improvement of the global best
+        self._islands = None # state of the islands of the island engine at the last checkpoint (for resuming)
 
+        # particles and personal bests are int arrays without start and end node, velocities (k, 2) int arrays
+        # of insertion moves; the operators never modify them in place, so they are shared instead of copied
         self.particles = [] # population
         self.velocities = []
         self.pbest = []
         self.gbest = None
 
-        self.precedences = None  # will contain precedence constraints as a list of pairs (created in _generate_precedences)
+        self.predecessors = None  # predecessors[i] = array of nodes that must precede i (created in _generate_predecessors)
         self.node_start = None
         self.node_stop = None
 
-        self._generate_precedences_and_start_stop_nodes()
-        self._initialize()
+        self._generate_predecessors_and_start_stop_nodes()
 
     def _initialize(self) -> None:
         """
@@ -56,70 +142,104 @@ class DPSO:
         lower_bound_displacement = math.floor(-self.particle_size / 3.) # floor(- n / 3)
         upper_bound_displacement = math.floor(self.particle_size / 3.) # floor(+ n / 3)
 
-        # set to generate values of nodes from (exclude start and end nodes)
-        set_nodes = set(range(self.particle_size)) - {self.node_start, self.node_end}
+        # nodes to generate values from (exclude start and end nodes)
+        set_nodes = np.setdiff1d(np.arange(self.particle_size), [self.node_start, self.node_end])
 
-        # set to generate values of displacements from
-        set_displacement = range(lower_bound_displacement, upper_bound_displacement + 1)
+        # displacements to generate values from
+        set_displacement = np.arange(lower_bound_displacement, upper_bound_displacement + 1)
 
         # initial permutation that does not contain start and end nodes
-        seed_perm = random.sample(set_nodes, self.particle_size - 2)  # random permutation without start and end nodes
+        seed_perm = self.rng.permutation(set_nodes)  # random permutation without start and end nodes
 
-        # parallelize the creation of each particle because fixing procedure is quite slow
-        with mp.Pool(processes=mp.cpu_count() - 1) as pool: # use max_cpu - 1 processes to avoid PC freezing
+        # parallelize the creation of each particle because fixing procedure is quite slow, the workers attach
+        # to the instance in shared memory once instead of receiving it with every particle
+        with share_instance(self.instance) as shared, \
+                mp.Pool(max(1, mp.cpu_count() - 1), initialize_worker, (shared.spec,)) as pool: # use max_cpu - 1 processes to avoid PC freezing
             param = (lower_bound_velocity_size, upper_bound_velocity_size, set_nodes, set_displacement, seed_perm)
-            mapping_params = [(i,) + param for i in range(self.pop_size)] # (i,) is process number for random seed
-            mapping_results = pool.map(self._create_single_particle, mapping_params)
+            mapping_params = [(rng,) + param for rng in self.rng.spawn(self.pop_size)] # own random stream
+            mapping_results = pool.map(_create_single_particle, mapping_params)
             for velocity, particle, cost in mapping_results:
-                self.velocities.append(deepcopy(velocity))
-                self.particles.append(deepcopy(particle))
-                self.pbest.append(deepcopy(particle))
+                self.velocities.append(velocity)
+                self.particles.append(particle)
+                self.pbest.append(particle)
                 if self.gbest is None or cost < self.cost(self.gbest):
-                    self.gbest = deepcopy(particle)
-        print('initial best:', self.gbest, self.cost(self.gbest))
+                    self.gbest = particle
+        print('initial best:', self.gbest.tolist(), self.cost(self.gbest))
 
-    def _create_single_particle(self, params):
+    @classmethod
+    def island(cls, instance, coefficients, particles, velocities, pbest, rng, gbest=None):
         """
-        This method is creating a single particle inside a process in a multiprocessing Pool
-        :param params: a pair containing: index, lower_bound_velocity_size, upper_bound_velocity_size, set_nodes, set_displacement, seed_perm
-        :return: a pair containing: velocity of particle, fixed particle, cost of particle
+        Creates a DPSO on a given part of a swarm (an island) without creating new particles.
+        :param instance: SOPInstance
+        :param coefficients: coef_inertia, coef_personal, coef_social
+        :param particles: list of particles
+        :param velocities: list of velocities
+        :param pbest: list of personal bests
+        :param rng: numpy random generator or seed
+        :param gbest: global best of the island (default: best personal best)
+        :return: DPSO
         """
-        index, lower_bound_velocity_size, upper_bound_velocity_size, set_nodes, set_displacement, seed_perm = params
-
-        random.seed(index)
-
-        # generate no. of insertion moves for current velocity
-        velocity_size = random.randint(lower_bound_velocity_size, upper_bound_velocity_size)
-
-        nodes = random.sample(set_nodes, velocity_size)  # generate nodes
-        displacements = random.sample(set_displacement, velocity_size)
-        velocity = list(zip(nodes, displacements))
-
-        unfixed_particle = op_perm_sum_velocity(x=seed_perm, v=velocity)
-        fixed_particle = op_perm_fix(x=self.full_particle(unfixed_particle), P=self.precedences)
-        cost = self.cost(fixed_particle)
-
-        # very important: have velocities that transform seed permutation into fixed one
-        velocity = op_perm_sub_perm(fixed_particle, seed_perm)
-
-        return velocity, fixed_particle, cost
-
-    def _generate_precedences_and_start_stop_nodes(self) -> None:
+        island = cls.__new__(cls)
+        island._setup(len(particles), *coefficients, instance.n, instance, np.random.default_rng(rng))
+        island.file_name = instance.name
+        island.particles, island.velocities, island.pbest = list(particles), list(velocities), list(pbest)
+        island.gbest = min(island.pbest, key=island.cost) if gbest is None else gbest
+        return island
+
+    def save_checkpoint(self, path : str) -> None:
+        """
+        Writes the swarm (particles, velocities, personal and global best), the state of the random generators and
+        the iteration atomically to a .npz file, see from_checkpoint.
+        :param path: path of the checkpoint file
+        """
+        arrays = {'particles': np.array(self.particles), 'pbest': np.array(self.pbest), 'gbest': self.gbest}
+        arrays['velocities'], arrays['lengths'] = stack_velocities(self.velocities, self.particle_size - 2)
+        meta = {'instance': self.instance.name, 'file_name': self.file_name, 'particle_size': self.particle_size,
+                'coefficients': [self.coef_inertia, self.coef_personal, self.coef_social],
+                'iteration': self.iteration, 'stagnation': self.stagnation, 'rng': rng_state(self.rng)}
+        if self._islands is not None:
+            arrays['island_gbest'] = np.array(self._islands['gbest'])
+            arrays['island_immigrants'] = np.array([self.gbest if immigrant is None else immigrant
+                                                    for immigrant in self._islands['immigrants']])
+            meta['island_rng'] = self._islands['rng']
+            meta['island_has_immigrant'] = [immigrant is not None for immigrant in self._islands['immigrants']]
+        write_checkpoint(path, arrays, meta)
+
+    @classmethod
+    def from_checkpoint(cls, path : str, weights_matrix : List[List]):
         """
-        Generates a list of precedences self.precedences = {(j,i) | Mij = -1}.
-        Determines start node as row# and end node as col# of max value in cost matrix.
+        Restores a swarm written by save_checkpoint. Continuing the optimization with the same engine (and number
+        of islands) gives exactly the same results as a run without interruption.
+        :param path: path of the checkpoint file
+        :param weights_matrix: the weights matrix or SOPInstance the swarm was created for
+        :return: DPSO
         """
-        M = -np.inf
-        self.node_start, self.node_end = -1, -1
-        self.precedences = []
-        for i in range(self.particle_size):
-            for j in range(self.particle_size):
-                v = self.weights_matrix[i][j]
-                if v == -1: # create precedences
-                    self.precedences.append((j, i)) # j must be visited before i
-                elif v > M: # determine start / end node
-                    M = v
-                    self.node_start, self.node_end = i, j
+        arrays, meta = read_checkpoint(path)
+        instance = as_instance(weights_matrix)
+        assert meta['particle_size'] == instance.n, '[DPSO::from_checkpoint] checkpoint belongs to another instance'
+
+        dpso = cls.__new__(cls)
+        dpso._setup(len(arrays['particles']), *meta['coefficients'], meta['particle_size'], instance,
+                    rng_from_state(meta['rng']))
+        dpso.file_name = meta['file_name']
+        dpso.particles = list(arrays['particles'])
+        dpso.velocities = unstack_velocities(arrays['velocities'], arrays['lengths'])
+        dpso.pbest = list(arrays['pbest'])
+        dpso.gbest = arrays['gbest']
+        dpso.iteration = meta['iteration']
+        dpso.stagnation = meta['stagnation']
+        if 'island_rng' in meta:
+            dpso._islands = {'gbest': list(arrays['island_gbest']), 'rng': meta['island_rng'],
+                             'immigrants': [immigrant if has_immigrant else None for immigrant, has_immigrant
+                                            in zip(arrays['island_immigrants'], meta['island_has_immigrant'])]}
+        return dpso
+
+    def _generate_predecessors_and_start_stop_nodes(self) -> None:
+        """
+        Takes the predecessor arrays self.predecessors[i] = {j | Mij = -1} and start and end node from the instance.
+        """
+        self.node_start, self.node_end = self.instance.start, self.instance.end
+        self.predecessors = self.instance.predecessors
 
     def cost(self, x : list) -> float:
         """
@@ -127,12 +247,12 @@ class DPSO:
         :param x: the permutation to compute the cost for
         :return: the cost of the permutation
         """
-        weight_1st_edge = self.weights_matrix[self.node_start][x[0]]
-        weight_2nd_edge = self.weights_matrix[x[-1]][self.node_end]
+        weight_1st_edge = self.weights_matrix[self.node_start, x[0]]
+        weight_2nd_edge = self.weights_matrix[x[-1], self.node_end]
 
-        c = sum([self.weights_matrix[x[i]][x[i + 1]] for i in range(self.particle_size - 2 - 1)])
+        c = self.weights_matrix[x[:-1], x[1:]].sum(dtype=np.int64)
 
-        return c + weight_1st_edge + weight_2nd_edge
+        return int(c + weight_1st_edge + weight_2nd_edge)
 
     def full_particle(self, x):
         """
@@ -140,71 +260,282 @@ class DPSO:
         :param x: the particle to be modified
         :return: a complete particle containing all nodes from 0 to particle_size-1 (valid permutation in math sense)
         """
-        return [self.node_start] + x + [self.node_end]
+        return np.concatenate(([self.node_start], x, [self.node_end]))
 
-    def optimize(self, out_file : str, iterations : int, verbose : bool = True) -> None:
+    def optimize(self, out_file : str, iterations : int, verbose : bool = True, engine : str = 'pool',
+                 islands : int = None, migration_interval : int = 10, time_budget : float = None,
+                 stagnation : int = None, checkpoint : str = None, checkpoint_interval : int = 100) -> None:
         """
         Runs Discrete Particle Swarm Optimization procedure
-        :param out_file: the file name to print the information to disk
-        :param iterations: total number of iterations to run the algorithm for
+        :param out_file: the file name to print the information to disk (appended to if the swarm continues)
+        :param iterations: total number of iterations to run the algorithm for (a swarm restored from a checkpoint
+                           continues at self.iteration)
         :param verbose: flag that indicates whether to print information to console
+        :param engine: 'pool' updates every particle in a separate task of a multiprocessing Pool,
+                       'vectorized' updates the whole swarm at once as (pop_size x n) arrays in this process,
+                       'islands' splits the swarm into sub-swarms which run the vectorized engine in long-lived
+                       worker processes attached to the instance in shared memory
+        :param islands: number of islands (worker processes) of the island engine, default max_cpu - 1
+        :param migration_interval: the islands exchange their best particles every migration_interval iterations
+        :param time_budget: stop after this many seconds (checked after every iteration or migration)
+        :param stagnation: stop if the global best did not improve for this many iterations
+        :param checkpoint: path of a .npz file the swarm is written to every checkpoint_interval iterations and at
+                           the end (see save_checkpoint and from_checkpoint)
+        :param checkpoint_interval: number of iterations between two checkpoints
         :return:
         """
-        with open(out_file, mode='w', buffering=1) as w:
-            out_str = f'step {0:4d}: best cost = {self.cost(self.gbest)}, best perm = {self.full_particle(self.gbest)}'
+        assert engine in ('pool', 'vectorized', 'islands'), '[DPSO::optimize] engine has to be pool, vectorized or islands'
+        with open(out_file, mode='a' if self.iteration else 'w', buffering=1) as w, ExitStack() as stack:
+            out_str = f'step {self.iteration:4d}: best cost = {self.cost(self.gbest)}, best perm = {self.full_particle(self.gbest).tolist()}'
             w.write(out_str + '\n')
             if verbose:
                 print(out_str)
 
-            # parallelism updates gbest after all processes finish their job and might not be that optimal,
-            # but it saves some time
-            with mp.Pool(mp.cpu_count() - 1) as pool:
-                last_cost = np.inf
-                for it in range(1, iterations + 1):
-                    mapping_params = list(zip(self.particles, self.velocities, self.pbest, [self.gbest] * self.pop_size))
-                    mapping_results = pool.map(self._optimization_step, mapping_params)
-                    self.particles, self.velocities, self.pbest, costs = map(list, zip(*mapping_results))
-
-                    gbest_cost = self.cost(self.gbest)
-                    for index, cost in enumerate(costs):
-                        if cost < gbest_cost:
-                            gbest_cost = cost
-                            self.gbest = deepcopy(self.particles[index])
-
-                    if gbest_cost < last_cost:
-                        last_cost = gbest_cost
-                    if it % 100 == 0:
-                        out_str = f'step {it:4d} / {iterations} file = {self.file_name} best cost = {self.cost(self.gbest)} best perm = {self.full_particle(self.gbest)}'
-                        w.write(out_str + '\n')
-                        if verbose:
-                            print(out_str)
-                out_str = f'END file = {self.file_name} best cost = {self.cost(self.gbest)} best perm = {self.full_particle(self.gbest)}'
-                w.write(out_str + '\n')
-                if verbose:
-                    print(out_str)
+            swarm, connections, immigrants = None, None, None
+            if engine == 'pool':
+                # parallelism updates gbest after all processes finish their job and might not be that optimal,
+                # but it saves some time
+                pool = stack.enter_context(mp.Pool(max(1, mp.cpu_count() - 1)))
+            elif engine == 'vectorized':
+                swarm = self._stack_swarm()
+            else:
+                shared = stack.enter_context(share_instance(self.instance))
+                connections, immigrants = self._start_islands(shared.spec, islands or max(1, mp.cpu_count() - 1))
+
+            start_time = time.perf_counter()
+            start_iteration = self.iteration
+            stop = 'iterations'
+            while self.iteration < iterations:
+                steps = min(migration_interval, iterations - self.iteration) if engine == 'islands' else 1
+                gbest_cost = self.cost(self.gbest)
+                if engine == 'pool':
+                    self._pool_iteration(pool)
+                elif engine == 'vectorized':
+                    swarm = self._vectorized_step(*swarm)
+                else:
+                    immigrants = self._islands_iteration(connections, steps, immigrants)
+                self.iteration += steps
+                self.stagnation = 0 if self.cost(self.gbest) < gbest_cost else self.stagnation + steps
+                elapsed = time.perf_counter() - start_time
+
+                if self.iteration // 100 > (self.iteration - steps) // 100:
+                    out_str = f'step {self.iteration:4d} / {iterations} file = {self.file_name} best cost = {self.cost(self.gbest)} it/s = {(self.iteration - start_iteration) / elapsed:.2f} best perm = {self.full_particle(self.gbest).tolist()}'
+                    w.write(out_str + '\n')
+                    if verbose:
+                        print(out_str)
+                if checkpoint is not None and \
+                        self.iteration // checkpoint_interval > (self.iteration - steps) // checkpoint_interval:
+                    self._collect_swarm(swarm, connections, immigrants)
+                    self.save_checkpoint(checkpoint)
+
+                if time_budget is not None and elapsed >= time_budget:
+                    stop = 'time budget'
+                    break
+                if stagnation is not None and self.stagnation >= stagnation:
+                    stop = 'stagnation'
+                    break
+
+            self._collect_swarm(swarm, connections, immigrants)
+            if engine == 'islands':
+                self._stop_islands(connections)
+            if checkpoint is not None:
+                self.save_checkpoint(checkpoint)
+            elapsed = time.perf_counter() - start_time
+            out_str = f'END file = {self.file_name} engine = {engine} iteration = {self.iteration} stop = {stop} best cost = {self.cost(self.gbest)} it/s = {(self.iteration - start_iteration) / max(elapsed, 1e-9):.2f} best perm = {self.full_particle(self.gbest).tolist()}'
+            w.write(out_str + '\n')
+            if verbose:
+                print(out_str)
+
+    def _collect_swarm(self, swarm, connections, immigrants) -> None:
+        """
+        Brings particles, velocities and personal bests up to date with the state of the vectorized engine (swarm)
+        or of the islands (connections), e.g. for writing a checkpoint. Nothing to do for the pool engine.
+        """
+        if swarm is not None:
+            self._unstack_swarm(*swarm)
+        if connections is not None:
+            islands = len(connections)
+            for connection, _ in connections:
+                connection.send('state')
+            self._islands = {'gbest': [], 'rng': [], 'immigrants': list(immigrants)}
+            for i, (connection, _) in enumerate(connections):
+                particles, velocities, pbest, gbest, state = connection.recv()
+                self.particles[i::islands], self.velocities[i::islands], self.pbest[i::islands] = \
+                    particles, velocities, pbest
+                self._islands['gbest'].append(gbest)
+                self._islands['rng'].append(state)
+
+    def _start_islands(self, instance_spec, islands : int):
+        """
+        Starts one worker process per island, island i owns the particles i, i + islands, i + 2 * islands, ...
+        Islands saved in a checkpoint with the same number of islands continue with their random generators.
+        :param instance_spec: SharedArrays.spec of the shared instance
+        :param islands: number of islands
+        :return: connections to the workers and the particles to send to the islands in the first migration
+        """
+        islands = min(islands, self.pop_size)
+        if self._islands is not None and len(self._islands['rng']) == islands:
+            rngs = [rng_from_state(state) for state in self._islands['rng']]
+            gbests, immigrants = self._islands['gbest'], self._islands['immigrants']
+        else:
+            rngs, gbests, immigrants = self.rng.spawn(islands), [None] * islands, [None] * islands
+
+        coefficients = (self.coef_inertia, self.coef_personal, self.coef_social)
+        connections = []
+        for i in range(islands):
+            connection, worker_connection = mp.Pipe()
+            worker = mp.Process(target=_island_worker, daemon=True,
+                                args=(worker_connection, instance_spec, self.instance.name, coefficients,
+                                      self.particles[i::islands], self.velocities[i::islands],
+                                      self.pbest[i::islands], rngs[i], gbests[i]))
+            worker.start()
+            worker_connection.close()
+            connections.append((connection, worker))
+        return connections, immigrants
+
+    def _islands_iteration(self, connections, iterations : int, immigrants):
+        """
+        Lets every island run iterations steps and exchanges the best particles along a ring: island i receives
+        the best particle of island i - 1 in the next round.
+        :param connections: connections to the workers (see _start_islands)
+        :param iterations: number of iterations until the next migration
+        :param immigrants: particle sent to every island (or None)
+        :return: immigrants of the next round
+        """
+        for (connection, _), immigrant in zip(connections, immigrants):
+            connection.send((iterations, immigrant))
+        bests = [connection.recv() for connection, _ in connections]
+
+        gbest_cost = self.cost(self.gbest)
+        for particle, cost in bests:
+            if cost < gbest_cost:
+                gbest_cost = cost
+                self.gbest = particle
+        return [particle for particle, _ in bests[-1:] + bests[:-1]]
+
+    def _stop_islands(self, connections) -> None:
+        """
+        Stops the workers of the islands (collect their state before with _collect_swarm).
+        """
+        for connection, _ in connections:
+            connection.send(None)
+        for connection, worker in connections:
+            worker.join()
+            connection.close()
+
+    def _immigrate(self, immigrant, X, V, lengths, P, pbest_costs) -> None:
+        """
+        Replaces the particle with the worst personal best of the vectorized engine state (modified in place)
+        by the immigrant, which becomes its own personal best.
+        :param immigrant: particle from another island
+        """
+        worst = int(np.argmax(pbest_costs))
+        cost = self.cost(immigrant)
+        X[worst] = P[worst] = immigrant
+        lengths[worst] = 0
+        pbest_costs[worst] = cost
+        if cost < self.cost(self.gbest):
+            self.gbest = immigrant
+
+    def _pool_iteration(self, pool) -> None:
+        """
+        One iteration of the pool engine: every particle is updated by _optimization_step in a task of the pool.
+        :param pool: multiprocessing Pool
+        """
+        mapping_params = list(zip(self.particles, self.velocities, self.pbest, [self.gbest] * self.pop_size,
+                                  self.rng.spawn(self.pop_size)))
+        mapping_results = pool.map(self._optimization_step, mapping_params)
+        self.particles, self.velocities, self.pbest, costs = map(list, zip(*mapping_results))
+
+        gbest_cost = self.cost(self.gbest)
+        for index, cost in enumerate(costs):
+            if cost < gbest_cost:
+                gbest_cost = cost
+                self.gbest = self.particles[index]
+
+    def _stack_swarm(self):
+        """
+        :return: state of the vectorized engine: particles, velocities, lengths of the velocities, personal bests
+                 and their costs as arrays with one row per particle
+        """
+        X = np.array(self.particles)
+        V, lengths = stack_velocities(self.velocities, X.shape[1])
+        P = np.array(self.pbest)
+        return X, V, lengths, P, swarm_costs(self._full_swarm(P), self.weights_matrix)
+
+    def _unstack_swarm(self, X, V, lengths, P, pbest_costs) -> None:
+        """
+        Stores the state of the vectorized engine in the lists used by the pool engine.
+        """
+        self.particles = list(X)
+        self.velocities = unstack_velocities(V, lengths)
+        self.pbest = list(P)
+
+    def _full_swarm(self, X):
+        """
+        :return: the particles (rows of X) with first and last node
+        """
+        pop = X.shape[0]
+        return np.column_stack((np.full(pop, self.node_start, dtype=X.dtype), X, np.full(pop, self.node_end, dtype=X.dtype)))
+
+    def _vectorized_step(self, X, V, lengths, P, pbest_costs):
+        """
+        One iteration of the vectorized engine, applies the formula (*) of _optimization_step to all particles at once.
+        :param X: particles (pop_size x n-2)
+        :param V: velocities and lengths of the velocities (see swarm.stack_velocities)
+        :param lengths: number of moves of the velocities
+        :param P: personal bests (pop_size x n-2)
+        :param pbest_costs: costs of the personal bests
+        :return: updated X, V, lengths, P, pbest_costs
+        """
+        pop = X.shape[0]
+        old_X = swarm_perm_fix(self._full_swarm(X), self.instance.pred_ptr, self.instance.pred_idx)
+
+        velocity_inertia = swarm_scalar_mul_velocity(np.full(pop, float(self.coef_inertia)), V, lengths, self.rng)
+        velocity_personal = swarm_scalar_mul_velocity(self.coef_personal * self.rng.uniform(0, 1, size=pop),
+                                                      *swarm_perm_sub_perm(P, X), self.rng)
+        velocity_social = swarm_scalar_mul_velocity(self.coef_social * self.rng.uniform(0, 1, size=pop),
+                                                    *swarm_perm_sub_perm(np.broadcast_to(self.gbest, X.shape), X),
+                                                    self.rng)
+
+        X = swarm_perm_sum_velocity(X, *velocity_inertia)
+        X = swarm_perm_sum_velocity(X, *velocity_personal)
+        X = swarm_perm_sum_velocity(X, *velocity_social)
+        X = swarm_perm_fix(self._full_swarm(X), self.instance.pred_ptr, self.instance.pred_idx)
+
+        V, lengths = swarm_perm_sub_perm(X, old_X)
+        costs = swarm_costs(self._full_swarm(X), self.weights_matrix)
+
+        # batched update of personal and global best
+        better = costs < pbest_costs
+        P = np.where(better[:, None], X, P)
+        pbest_costs = np.where(better, costs, pbest_costs)
+        best = int(np.argmin(costs))
+        if costs[best] < self.cost(self.gbest):
+            self.gbest = X[best].copy()
+        return X, V, lengths, P, pbest_costs
 
     def _optimization_step(self, param):
         """
         This method is run on a separate process at each iteration.
         Applies the formula (*) - see it below - for one particle
-        :param param: contains particle, velocity, pbest and gbest, all needed to implement formula
+        :param param: contains particle, velocity, pbest, gbest and random generator, all needed to implement formula
         :return: returns updated values for particle, velocity, pbest and gbest
         """
-        particle, velocity, pbest, gbest = param
-        # save particle because we will compute velocity at the end
-        old_particle = deepcopy(particle)
-        old_particle = op_perm_fix(x=self.full_particle(old_particle),P=self.precedences)
+        particle, velocity, pbest, gbest, rng = param
+        # save particle because we will compute velocity at the end (the operators return new arrays)
+        old_particle = op_perm_fix(x=self.full_particle(particle), predecessors=self.predecessors)
 
         # apply formula (*): v(k+1) = [inertia * v(k)] + [personal * rand() * (p(i) - x(i))] + [social * rand() * (g - x(i))]
 
         # compute each term inside square brackets
-        velocity_inertia = op_scalar_mul_velocity(c=self.coef_inertia, v=velocity)
+        velocity_inertia = op_scalar_mul_velocity(c=self.coef_inertia, v=velocity, rng=rng)
 
         diff_velocity_personal = op_perm_sub_perm(pbest, particle)
-        velocity_personal = op_scalar_mul_velocity(self.coef_personal * U(0, 1), diff_velocity_personal)
+        velocity_personal = op_scalar_mul_velocity(self.coef_personal * rng.uniform(0, 1), diff_velocity_personal, rng)
 
         diff_velocity_social = op_perm_sub_perm(gbest, particle)
-        velocity_social = op_scalar_mul_velocity(self.coef_social * U(0, 1), diff_velocity_social)
+        velocity_social = op_scalar_mul_velocity(self.coef_social * rng.uniform(0, 1), diff_velocity_social, rng)
 
         # apply each velocity individually to particle because we don't have a velocity + velocity operator
         particle = op_perm_sum_velocity(particle, velocity_inertia)
@@ -212,7 +543,7 @@ class DPSO:
         particle = op_perm_sum_velocity(particle, velocity_social)
 
         # fix current particle so that it repects precedence constraints
-        particle = op_perm_fix(x=self.full_particle(particle), P=self.precedences)
+        particle = op_perm_fix(x=self.full_particle(particle), predecessors=self.predecessors)
 
         # compute velocity that transforms old_particle into self.patricles[i]
         velocity = op_perm_sub_perm(particle, old_particle)
@@ -220,10 +551,9 @@ class DPSO:
         cost = self.cost(particle)
 
         # update personal best in case we got a better particle than previous personal best
+        # the global best is updated by the main process from the returned costs (this runs in a copy of self)
         if cost < self.cost(pbest):
-            pbest = deepcopy(particle)
-        if cost < self.cost(self.gbest):
-            self.gbest = deepcopy(particle)
+            pbest = particle
 
         return particle, velocity, pbest, cost
 
@@ -234,10 +564,7 @@ class DPSO:
         :return:
         """
         fp = self.full_particle(particle)
-        for i in range(len(fp) - 1):
-            if self.weights_matrix[fp[i]][fp[i+1]] < 0:
-                return False
-        return True
+        return not self.instance.precedence[fp[:-1], fp[1:]].any() # fp[i+1] must not precede fp[i]
 
     @staticmethod
     def lists_are_equal(A, B):
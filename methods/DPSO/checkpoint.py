@@ -0,0 +1,61 @@
+import json
+import os
+import tempfile
+import numpy as np
+from typing import Dict, Tuple
+
+# Checkpoints are uncompressed .npz files of numpy arrays plus one entry 'meta' holding a JSON string with the
+# scalar state (iteration, coefficients, states of the random generators, ...). They are written to a temporary
+# file which replaces the previous checkpoint at the end, so a checkpoint on disk is always complete.
+
+
+def rng_state(rng : np.random.Generator) -> dict:
+    """
+    :param rng: numpy random generator.
+    :return: JSON serializable state of rng, including the seed sequence (it counts the spawned child streams).
+    """
+    seed_seq = rng.bit_generator.seed_seq
+    return {'bit_generator': rng.bit_generator.state,
+            'entropy': seed_seq.entropy,
+            'spawn_key': list(seed_seq.spawn_key),
+            'pool_size': seed_seq.pool_size,
+            'n_children_spawned': seed_seq.n_children_spawned}
+
+def rng_from_state(state : dict) -> np.random.Generator:
+    """
+    :param state: state returned by rng_state.
+    :return: numpy random generator which continues exactly like the generator the state was taken from.
+    """
+    seed_seq = np.random.SeedSequence(state['entropy'], spawn_key=tuple(state['spawn_key']),
+                                      pool_size=state['pool_size'], n_children_spawned=state['n_children_spawned'])
+    bit_generator = getattr(np.random, state['bit_generator']['bit_generator'])(seed_seq)
+    bit_generator.state = state['bit_generator']
+    return np.random.Generator(bit_generator)
+
+def write_checkpoint(path : str, arrays : Dict[str, np.ndarray], meta : dict) -> None:
+    """
+    Atomically writes a checkpoint.
+    :param path: path of the checkpoint file (.npz).
+    :param arrays: arrays to store.
+    :param meta: JSON serializable dict.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.npz')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+def read_checkpoint(path : str) -> Tuple[Dict[str, np.ndarray], dict]:
+    """
+    :param path: path of a checkpoint written by write_checkpoint.
+    :return: the stored arrays and meta dict.
+    """
+    with np.load(path) as data:
+        arrays = {key: data[key] for key in data.files if key != 'meta'}
+        meta = json.loads(str(data['meta']))
+    return arrays, meta
@@ -1,9 +1,13 @@
 import math
-import random
+import numpy as np
 from copy import deepcopy
 from typing import List
 
-def check_permutation(perm : list, lowest : int = 1) -> bool:
+# Particles (permutations) are 1 dim int arrays of distinct nodes, velocities are (k, 2) int arrays of insertion
+# moves (node, displacement). The operators never modify their arguments, so results can be shared without copies.
+
+
+def check_permutation(perm : np.ndarray, lowest : int = 1) -> bool:
     """
     Permutation a is valid if it has length n > 1 and contains all numbers from lowest to n+lowest.
     :param perm: the permutation to be checked.
@@ -14,44 +18,52 @@ def check_permutation(perm : list, lowest : int = 1) -> bool:
     n = len(perm)
     if n <= 1:
         return False
-    for x in range(lowest, n + lowest):
-        if x not in perm:
-            return False
-    return True
+    return np.array_equal(np.sort(perm), np.arange(lowest, n + lowest))
+
+def inverse_permutation(perm : np.ndarray, size : int = None) -> np.ndarray:
+    """
+    Builds the inverse-position index of a permutation.
+    :param perm: the permutation.
+    :param size: length of the index, has to be larger than every node of perm (default: largest node + 1).
+    :return: position s.t. position[perm[i]] = i (entries of nodes that are not in perm are undefined).
+    """
+    if size is None:
+        size = int(perm.max()) + 1
+    position = np.empty(size, dtype=np.int32)
+    position[perm] = np.arange(perm.size, dtype=np.int32)
+    return position
 
-def random_round(x : float) -> int:
+def random_round(x : np.ndarray, rng : np.random.Generator) -> np.ndarray:
     """
-    Randommy round x to floor(x) or ceil(x) with probability 0.5.
-    :param x: the number to be rounded.
-    :return: floor(x) or ceil(x) with probability 0.5.
+    Randomly round every entry of x to floor(x) or ceil(x) with probability 0.5.
+    :param x: the numbers to be rounded.
+    :param rng: numpy random generator.
+    :return: floor(x) or ceil(x) with probability 0.5 (int array).
     """
-    u = random.uniform(a = 0.0, b = 1.0)
-    return math.floor(x) if u < 0.5 else math.ceil(x)
+    u = rng.uniform(0.0, 1.0, size=np.shape(x))
+    return np.where(u < 0.5, np.floor(x), np.ceil(x)).astype(np.int32)
 
 
-def op_perm_sub_perm(a : list, b : list, allow_checks : bool = False) -> List[tuple]:
+def op_perm_sub_perm(a : np.ndarray, b : np.ndarray, allow_checks : bool = False) -> np.ndarray:
     """
     Performs operation velocity = a - b.
     Performs subtraction of two permutations. The result is velocity vector.
-    A velocity vector is a list of tuples (i,d) where i=node and d=displacement.
+    A velocity vector is a (k, 2) array of rows (i,d) where i=node and d=displacement.
     :param a: the first permutation.
     :param b: the second permutation.
     :param allow_checks: flag to check whether parameters are valid. It may slow algorithm if set to True.
-    :return: v = a - b = list of insertion moves that need to be applied to b to obtain a.
+    :return: v = a - b = insertion moves that need to be applied to b to obtain a.
     """
     if allow_checks:
         assert check_permutation(a), '[operations::difference] first permutation is not valid one'
         assert check_permutation(b), '[operations::difference] second permutation is not valid one'
         assert len(a) == len(b), '[operations::difference] both permutations must have same size'
 
-    velocity = []
-    for j, x in enumerate(b):
-        i = a.index(x) # index of element x in a
-        if i != j:
-            velocity.append((x, i-j))
-    return deepcopy(velocity)
+    displacement = inverse_permutation(a)[b] - np.arange(b.size, dtype=np.int32) # index of x in a minus index in b
+    moved = displacement != 0
+    return np.column_stack((b[moved], displacement[moved])).astype(np.int32, copy=False)
 
-def op_scalar_mul_velocity(c : float, v : List[tuple]) -> List[tuple]:
+def op_scalar_mul_velocity(c : float, v : np.ndarray, rng : np.random.Generator) -> np.ndarray:
     """
     Performs operation velocity = scalar * velocity.
     Performs multiplication w = c * v in the following way:
@@ -59,21 +71,19 @@ def op_scalar_mul_velocity(c : float, v : List[tuple]) -> List[tuple]:
     if c > 1: we obtain w = [(j_k, rr(c*d_k)) | k = 1..|v|], where rr(a) = floor(a) or ceil(a) with uniform prob 0.5.
     :param c: the constant to multiply the velocity with.
     :param v: the velocity vector to be multiplied with c.
-    :return: a new velocity set w = c * v
+    :param rng: numpy random generator.
+    :return: a new velocity set w = c * v (v itself if c = 1)
     """
     assert c > 0, '[operations::scalar_multiplication] the constant c must be positive'
     if c < 1:
         n = len(v)
         size = math.ceil(c * n)
-        indexes = random.sample(range(n), size)
-        w = [v[i] for i in indexes]
-        return deepcopy(w)
+        return v[rng.choice(n, size, replace=False)]
     if c > 1:
-        w = [(i, random_round(c * d)) for (i, d) in v]
-        return deepcopy(w)
-    return deepcopy(v)
+        return np.column_stack((v[:, 0], random_round(c * v[:, 1], rng))).astype(np.int32, copy=False)
+    return v
 
-def op_perm_sum_velocity(x : list, v : List[tuple]) -> list:
+def op_perm_sum_velocity(x : np.ndarray, v : np.ndarray) -> np.ndarray:
     """
     Performs operation perm = perm + velocity.
     Apply insertion moves (IMs) in v to x.
@@ -82,18 +92,57 @@ def op_perm_sum_velocity(x : list, v : List[tuple]) -> list:
     :return: y = x + v = permutation x modified by v.
     """
     n = len(x)
-    y = deepcopy(x)
+    y = x.copy()
+    position = inverse_permutation(y)
     for node, disp in v: # disp = displacement
-        node_index = y.index(node)
-        del y[node_index]
-        insert_position = max(0, node_index + disp) if disp < 0 else min(n-1, node_index + disp)
-        y.insert(insert_position, node)
-    return deepcopy(y)
+        node_index = int(position[node])
+        insert_position = min(max(0, node_index + disp), n - 1)
+        # shift the nodes between both indexes by one position and update only their positions
+        if insert_position > node_index:
+            y[node_index:insert_position] = y[node_index + 1:insert_position + 1]
+            y[insert_position] = node
+            position[y[node_index:insert_position + 1]] = np.arange(node_index, insert_position + 1)
+        elif insert_position < node_index:
+            y[insert_position + 1:node_index + 1] = y[insert_position:node_index]
+            y[insert_position] = node
+            position[y[insert_position:node_index + 1]] = np.arange(insert_position, node_index + 1)
+    return y
 
-def op_perm_fix(x : list, P : List[tuple]) -> list:
+def op_perm_fix(x : np.ndarray, predecessors : List[np.ndarray]) -> np.ndarray:
+    """
+    Force x satisfy precedence constraints by changing as less as possible the order of nodes in x.
+    In case x already satisfies precedence constraints, then it won't be modified in any way.
+    Gives the same result as op_perm_fix_naive, but instead of searching all pairs of positions for a precedence
+    constraint, the positions of the predecessors of a node are looked up in a position map (O(n * deg) checks).
+    :param x: the permutation to be modified to respect precedence constraints (including first and last node).
+    :param predecessors: predecessors[j] = array of nodes that must precede j (e.g. SOPInstance.predecessors).
+    :return: y = the permutation obtained from x that respects now precedence constraints (without first and last node).
+    """
+    y = np.array(x)
+    n = y.size
+    position = inverse_permutation(y, n) # position[node] = index of node in y
+    k = n - 1
+    while 1 <= k:
+        j = y[k]
+        # last position of a predecessor of j (the last position of y is not searched, as in the naive version)
+        h = position[predecessors[j]]
+        h = h[h < n - 1]
+        f = h.max() if h.size else 0
+        if f < k:
+            k = k - 1
+        else:
+            # move j behind its last predecessor, the nodes in between move one position to the front
+            y[k:f] = y[k + 1:f + 1]
+            y[f] = j
+            position[y[k:f + 1]] = np.arange(k, f + 1)
+            k = f - 2
+    return y[1:-1] # get rid of first and last nodes
+
+def op_perm_fix_naive(x : list, P : List[tuple]) -> list:
     """
     Force x satisfy precedence constraints in R by changing as less as possible the order of nodes in x.
     In case x already satisfies precedence constraints in R, then it won't be modified in any way.
+    Reference implementation of op_perm_fix, it checks every pair of positions against P (O(n^2 * |P|)).
     :param x: the permutation to be modified to respect precedence constraints in R.
     :param P: the precedence constraints: R = {(i,j) meaning that i must precede j in permutation}.
     :return: y = the permutation obtained from x that respects now precedence constraints R.
@@ -116,4 +165,37 @@ def op_perm_fix(x : list, P : List[tuple]) -> list:
              y.insert(f, j)
              k = f - 2
     # print('fixed', y)
-    return deepcopy(y[1:-1]) # get rid of first and last nodes (may give up this implementation)
\ No newline at end of file
+    return deepcopy(y[1:-1]) # get rid of first and last nodes (may give up this implementation)
+
+
+if __name__ == "__main__":
+    import time
+    from helper.parser import filenames
+    from helper.cache import load_instance
+
+    # differential check of op_perm_fix against op_perm_fix_naive on random permutations and a benchmark of both
+    sop_path = "../../Data/course_benchmark_instances/"
+    sop_files, _ = filenames([sop_path, sop_path])
+    rng = np.random.default_rng(0)
+
+    for sop_file in sop_files:
+        instance = load_instance(sop_file)
+        n = instance.n
+        P = [(int(j), i) for i in range(n) for j in instance.predecessors[i]]
+        P_set = set(P) # same answers as the list, only used to keep the check feasible on large instances
+        runs = 20 if n <= 100 else 3
+
+        perms = [np.concatenate(([0], rng.permutation(np.arange(1, n - 1)), [n - 1])) for _ in range(runs)]
+
+        start = time.perf_counter()
+        fixed = [op_perm_fix(x, instance.predecessors) for x in perms]
+        time_fast = (time.perf_counter() - start) / runs
+
+        start = time.perf_counter()
+        reference = [op_perm_fix_naive(x.tolist(), P if n <= 100 else P_set) for x in perms]
+        time_naive = (time.perf_counter() - start) / runs
+
+        assert all(np.array_equal(y, z) for y, z in zip(fixed, reference)), \
+            'op_perm_fix differs from op_perm_fix_naive on ' + instance.name
+        print('{0:16s} n = {1:3d}  |P| = {2:6d}  naive{3} = {4:9.4f} s  fix = {5:.4f} s'.format(
+            instance.name, n, len(P), ' (list)' if n <= 100 else ' (set) ', time_naive, time_fast))
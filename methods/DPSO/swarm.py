@@ -0,0 +1,204 @@
+import math
+import numpy as np
+from typing import List, Tuple
+
+# Whole-swarm versions of the operators in operations.py. The swarm is a (pop_size, m) int array with one
+# permutation per row, velocities are (pop_size, L, 2) int arrays of insertion moves (node, displacement) together
+# with an array lengths, where only the first lengths[r] moves of row r are used.
+# Every operator gives row by row the same result as the corresponding operator in operations.py.
+
+
+def swarm_positions(X : np.ndarray, size : int = None) -> np.ndarray:
+    """
+    Builds the inverse-position index of every row of X.
+    :param X: the swarm.
+    :param size: number of columns of the index, has to be larger than every node (default: largest node + 1).
+    :return: position s.t. position[r, X[r, i]] = i.
+    """
+    if size is None:
+        size = int(X.max()) + 1
+    position = np.zeros((X.shape[0], size), dtype=np.int32)
+    np.put_along_axis(position, X, np.arange(X.shape[1], dtype=np.int32)[None, :], axis=1)
+    return position
+
+def stack_velocities(velocities : List[np.ndarray], width : int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param velocities: list of (k, 2) velocity arrays (see operations.py).
+    :param width: maximal number of moves of a velocity.
+    :return: velocities padded to a (len(velocities), width, 2) array and the number of moves of every row.
+    """
+    V = np.zeros((len(velocities), width, 2), dtype=np.int32)
+    lengths = np.array([len(v) for v in velocities], dtype=np.int64)
+    for r, v in enumerate(velocities):
+        V[r, :len(v)] = v
+    return V, lengths
+
+def unstack_velocities(V : np.ndarray, lengths : np.ndarray) -> List[np.ndarray]:
+    """
+    :return: list of (k, 2) velocity arrays, inverse of stack_velocities.
+    """
+    return [V[r, :lengths[r]].copy() for r in range(V.shape[0])]
+
+def swarm_costs(X : np.ndarray, W : np.ndarray) -> np.ndarray:
+    """
+    :param X: swarm of complete particles (including first and last node).
+    :param W: the weights matrix.
+    :return: cost of every particle.
+    """
+    return W[X[:, :-1], X[:, 1:]].sum(axis=1, dtype=np.int64)
+
+def _move(X : np.ndarray, position : np.ndarray, rows : np.ndarray, source : np.ndarray, target : np.ndarray) -> None:
+    """
+    Moves in every given row the node at index source[r] to index target[r], the nodes in between are shifted
+    by one position. X and position (if not None) are modified in place.
+    Only the cells between source and target are touched, so the work is proportional to the displacements.
+    """
+    low = np.minimum(source, target)
+    size = np.abs(target - source) + 1
+
+    # (row, column) of every touched cell
+    cell_rows = rows.repeat(size)
+    offsets = np.arange(size.sum()) - np.repeat(np.cumsum(size) - size, size)
+    columns = low.repeat(size) + offsets
+
+    # forward: the nodes after source move one position to the front, backward: the nodes before source move back
+    forward = (target > source).repeat(size)
+    nodes = X[cell_rows, np.where(forward, columns + 1, columns - 1).clip(0, X.shape[1] - 1)]
+    at_target = columns == target.repeat(size)
+    nodes[at_target] = X[rows, source]
+    X[cell_rows, columns] = nodes
+    if position is not None:
+        position[cell_rows, nodes] = columns
+
+def swarm_perm_sub_perm(A : np.ndarray, B : np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Performs operation velocity = a - b for every row (see operations.op_perm_sub_perm).
+    :param A: the first permutations.
+    :param B: the second permutations (same nodes as A in every row).
+    :return: velocities and lengths s.t. row r contains the insertion moves that need to be applied to B[r] to obtain A[r].
+    """
+    displacement = np.take_along_axis(swarm_positions(A), B, axis=1) - np.arange(B.shape[1], dtype=np.int32)
+    moved = displacement != 0
+
+    # moved nodes to the front of every row, in the order of B
+    order = np.argsort(~moved, axis=1, kind='stable')
+    V = np.stack((np.take_along_axis(B, order, axis=1), np.take_along_axis(displacement, order, axis=1)), axis=2)
+    return V.astype(np.int32, copy=False), moved.sum(axis=1)
+
+def swarm_scalar_mul_velocity(c : np.ndarray, V : np.ndarray, lengths : np.ndarray,
+                              rng : np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Performs operation velocity = scalar * velocity for every row (see operations.op_scalar_mul_velocity).
+    :param c: the positive constant of every row.
+    :param V: the velocities.
+    :param lengths: the number of moves of every velocity.
+    :param rng: numpy random generator.
+    :return: velocities and lengths of W = c * V
+    """
+    assert (c > 0).all(), '[swarm::scalar_multiplication] the constants c must be positive'
+    V = V.copy()
+    lengths = lengths.copy()
+    columns = np.arange(V.shape[1])[None, :]
+
+    # c < 1: keep ceil(c * |v|) randomly chosen moves
+    shrink = np.flatnonzero(c < 1)
+    if shrink.size:
+        keys = rng.uniform(0.0, 1.0, size=(shrink.size, V.shape[1]))
+        keys[columns >= lengths[shrink, None]] = 2.0 # unused moves are sorted to the end
+        order = np.argsort(keys, axis=1)
+        V[shrink] = np.take_along_axis(V[shrink], order[:, :, None], axis=1)
+        lengths[shrink] = [math.ceil(c_r * k) for c_r, k in zip(c[shrink], lengths[shrink])]
+
+    # c > 1: displacements rr(c * d) rounded randomly
+    grow = np.flatnonzero(c > 1)
+    if grow.size:
+        x = c[grow, None] * V[grow, :, 1]
+        u = rng.uniform(0.0, 1.0, size=x.shape)
+        V[grow, :, 1] = np.where(u < 0.5, np.floor(x), np.ceil(x))
+    return V, lengths
+
+def swarm_perm_sum_velocity(X : np.ndarray, V : np.ndarray, lengths : np.ndarray) -> np.ndarray:
+    """
+    Performs operation perm = perm + velocity for every row (see operations.op_perm_sum_velocity).
+    The t-th moves of all rows are applied at the same time.
+    :param X: the permutations to be modified.
+    :param V: the insertion moves to be applied.
+    :param lengths: the number of moves of every velocity.
+    :return: Y = X + V
+    """
+    Y = X.copy()
+    n = X.shape[1]
+    position = swarm_positions(Y)
+    for t in range(int(lengths.max(initial=0))):
+        rows = np.flatnonzero(lengths > t)
+        nodes = V[rows, t, 0]
+        source = position[rows, nodes]
+        target = np.clip(source + V[rows, t, 1], 0, n - 1)
+        _move(Y, position, rows, source, target)
+    return Y
+
+def swarm_perm_fix(X : np.ndarray, pred_ptr : np.ndarray, pred_idx : np.ndarray) -> np.ndarray:
+    """
+    Force every row of X satisfy precedence constraints (see operations.op_perm_fix). All rows run the fixing
+    procedure in lockstep, every row with its own index k.
+    :param X: the permutations to be modified (including first and last node).
+    :param pred_ptr: predecessors of every node in compressed sparse row format (SOPInstance.pred_ptr, pred_idx).
+    :param pred_idx: see pred_ptr.
+    :return: Y = the permutations obtained from X that respect now precedence constraints (without first and last node).
+    """
+    Y = X.copy()
+    n = Y.shape[1]
+    position = swarm_positions(Y, n)
+    k = np.full(Y.shape[0], n - 1)
+    rows = np.flatnonzero(k >= 1)
+    while rows.size:
+        j = Y[rows, k[rows]]
+
+        # positions of the predecessors of j; every row gets an additional entry 0, the value of f without any
+        # predecessor, and the last position is not searched (as in op_perm_fix)
+        size = pred_ptr[j + 1] - pred_ptr[j] + 1
+        starts = np.cumsum(size) - size
+        offsets = np.arange(starts[-1] + size[-1]) - starts.repeat(size)
+        predecessors = pred_idx[pred_ptr[j].repeat(size) + offsets - 1]
+        h = position[rows.repeat(size), predecessors]
+        h[(offsets == 0) | (h == n - 1)] = 0
+        f = np.maximum.reduceat(h, starts)
+
+        move = f >= k[rows]
+        k[rows[~move]] -= 1
+        if move.any():
+            moving = rows[move]
+            _move(Y, position, moving, k[moving], f[move])
+            k[moving] = f[move] - 2
+        rows = np.flatnonzero(k >= 1)
+    return Y[:, 1:-1]
+
+if __name__ == "__main__":
+    from helper.parser import filenames
+    from helper.cache import load_instance
+    from methods.DPSO.operations import op_perm_sub_perm, op_perm_sum_velocity, op_perm_fix
+
+    # differential check of the swarm operators against the operators of single particles
+    sop_path = "../../Data/course_benchmark_instances/"
+    sop_files, _ = filenames([sop_path, sop_path])
+    rng = np.random.default_rng(0)
+
+    for sop_file in sop_files:
+        instance = load_instance(sop_file)
+        n = instance.n
+        pop_size = 20
+        X = np.array([rng.permutation(np.arange(1, n - 1)) for _ in range(pop_size)])
+        full = np.column_stack((np.zeros(pop_size, dtype=X.dtype), X, np.full(pop_size, n - 1, dtype=X.dtype)))
+
+        fixed = swarm_perm_fix(full, instance.pred_ptr, instance.pred_idx)
+        assert all(np.array_equal(fixed[r], op_perm_fix(full[r], instance.predecessors)) for r in range(pop_size))
+
+        V, lengths = swarm_perm_sub_perm(fixed, X)
+        assert all(np.array_equal(V[r, :lengths[r]], op_perm_sub_perm(fixed[r], X[r])) for r in range(pop_size))
+
+        # random scaling, the moves have to be the same in both versions
+        W, W_lengths = swarm_scalar_mul_velocity(rng.uniform(0.1, 5.0, size=pop_size), V, lengths, rng)
+        Y = swarm_perm_sum_velocity(X, W, W_lengths)
+        assert all(np.array_equal(Y[r], op_perm_sum_velocity(X[r], W[r, :W_lengths[r]])) for r in range(pop_size))
+        assert np.array_equal(swarm_costs(full, instance.costs), [instance.path_cost(x) for x in full])
+        print(instance.name, 'ok')
@@ -0,0 +1,356 @@
+# Ant Colony System for the sequential ordering problem, hybridized with a local search applied to the best ant
+# of every iteration (HAS-SOP: Gambardella, Dorigo: An Ant Colony System Hybridized with a New Local Search for
+# the Sequential Ordering Problem, 2000)
+
+import multiprocessing as mp
+import time
+import numpy as np
+from helper.instance import as_instance
+from helper.shared import attach_instance, share_instance
+from methods.greedy_method import greedy
+from methods.local_search.sop_3_exchange import sop_3_exchange
+
+
+def _choose(values, ready, exploit, draws):
+    """
+    ACS transition rule for every row: the column with the largest value (exploitation) or a column drawn with
+    probability proportional to its value (biased exploration).
+
+    :param values: pheromone times heuristic value of every column (one row per ant)
+    :param ready: bool mask of the columns which can be chosen, every row has at least one
+    :param exploit: bool array, True for the rows which exploit
+    :param draws: uniform random number in [0, 1) of every row
+    :return: chosen column of every row
+    """
+    # ready columns get a positive value, even if the pheromone underflows
+    values = np.where(ready, np.maximum(values, np.finfo(float).tiny), 0.0)
+    cumulative = np.cumsum(values, axis=1)
+    explore = np.argmax(cumulative > draws[:, np.newaxis] * cumulative[:, -1:], axis=1)
+    return np.where(exploit, values.argmax(axis=1), explore)
+
+
+def reduction_matrix(instance):
+    """
+    :param instance: SOPInstance
+    :return: (n, n) int16 (int32 for n > 32767) matrix, entry [v, s] is 1 if v is a predecessor of s in the
+             transitive reduction (subtracting row v updates the counters of unvisited predecessors)
+    """
+    n = instance.n
+    graph = instance.precedence_graph
+    reduced = np.zeros((n, n), dtype=np.int16 if n <= np.iinfo(np.int16).max else np.int32)
+    reduced[graph.reduced_idx, np.repeat(np.arange(n), graph.reduced_count)] = 1
+    return reduced
+
+
+def construct_ants(instance, pheromone, heuristic, ants, q0, rho, tau0, rng, candidates=None, reduced=None):
+    """
+    Build the paths of all ants of one iteration in lockstep (one row per ant).
+
+    The ready vertices of every ant are tracked by counting its unvisited predecessors in the transitive
+    reduction (as helper.frontier.ReadySet, one row of counters per ant). An ant at vertex r moves to the ready
+    vertex s maximizing pheromone[r, s] * heuristic[r, s] with probability q0, otherwise s is drawn with
+    probability proportional to this value. With candidates=k only the ready vertices among the k cheapest live
+    successors of r are considered (see helper.candidates), or all ready vertices if none of them is ready.
+    After every step the local pheromone update pheromone = (1 - rho) * pheromone + rho * tau0 is applied to all
+    arcs chosen in this step.
+
+    :param instance: SOPInstance
+    :param pheromone: (n, n) float matrix, modified in place by the local update
+    :param heuristic: (n, n) float matrix, heuristic values of the arcs (already raised to the power beta)
+    :param ants: number of ants
+    :param q0: probability of exploitation
+    :param rho: evaporation of the local update
+    :param tau0: initial pheromone value
+    :param rng: numpy random generator
+    :param candidates: length of the candidate lists (optional)
+    :param reduced: reduction_matrix of the instance (built if not given)
+    :return: tuple of the paths (one row per ant) and their costs
+    """
+    n = instance.n
+    costs = instance.costs
+    live = instance.live_arcs.mask
+    graph = instance.precedence_graph
+    candidate_lists = None if candidates is None else instance.candidates(candidates)
+
+    reduced = reduction_matrix(instance) if reduced is None else reduced
+
+    # number of unvisited predecessors of every vertex, visited vertices are marked with -1
+    remaining = np.tile(graph.reduced_count.astype(reduced.dtype) - reduced[instance.start], (ants, 1))
+    remaining[:, instance.start] = -1
+    paths = np.empty((ants, n), dtype=np.int32)
+    paths[:, 0] = instance.start
+    rows = np.arange(ants)
+
+    for step in range(1, n):
+        last = paths[:, step - 1]
+        exploit = rng.random(ants) < q0
+        draws = rng.random(ants)
+        vertices = np.empty(ants, dtype=np.int64)
+
+        if candidate_lists is None:
+            full = rows
+            ready_full = (remaining == 0) & live[last]
+        else:
+            columns, ready, full, ready_full = candidate_lists.restrict(
+                last, lambda rows, columns: remaining[rows[:, np.newaxis], columns] == 0)
+            restricted = np.flatnonzero(ready.any(axis=1))
+
+            origins = last[restricted, np.newaxis]
+            choice = _choose(pheromone[origins, columns[restricted]] * heuristic[origins, columns[restricted]],
+                             ready[restricted], exploit[restricted], draws[restricted])
+            vertices[restricted] = columns[restricted, choice]
+
+        if full.size:
+            if not ready_full.any(axis=1).all():
+                raise RuntimeError("No feasible solution found for this instance.")
+            vertices[full] = _choose(pheromone[last[full]] * heuristic[last[full]], ready_full, exploit[full],
+                                     draws[full])
+
+        paths[:, step] = vertices
+        remaining -= reduced[vertices]
+        remaining[rows, vertices] = -1
+        pheromone[last, vertices] = (1 - rho) * pheromone[last, vertices] + rho * tau0
+
+    return paths, costs[paths[:, :-1], paths[:, 1:]].sum(axis=1, dtype=np.int64)
+
+
+class Colony:
+    """
+    One ant colony: pheromone matrix, best path found so far and random generator.
+
+    A colony is pickled without its instance, heuristic values and reduction matrix (the worker processes of
+    ant_colony_system attach it to the instance in shared memory, see attach).
+    """
+
+    def __init__(self, instance, initial_path, initial_cost, ants=10, q0=None, alpha=0.1, rho=0.1, beta=2.0,
+                 candidates=15, local_search=sop_3_exchange, rng=None):
+        """
+
+        :param instance: SOPInstance
+        :param initial_path: feasible path, tau0 = 1 / (n * initial_cost)
+        :param initial_cost: cost of initial_path
+        :param ants: number of ants per iteration
+        :param q0: probability of exploitation, 1 - 5 / n by default (on average 5 explored arcs per ant)
+        :param alpha: evaporation of the global update
+        :param rho: evaporation of the local update
+        :param beta: weight of the heuristic value 1 / (cost + 1)
+        :param candidates: length of the candidate lists (None for no candidate lists)
+        :param local_search: None or function (instance, path, time_budget=...) -> (path, cost), e.g. one of
+                             methods.local_search, applied to the best ant of every iteration
+        :param rng: numpy random generator
+        """
+        self.attach(instance)
+        n = instance.n
+        self.ants = ants
+        self.q0 = 1 - 5 / n if q0 is None else q0
+        self.alpha = alpha
+        self.rho = rho
+        self.beta = beta
+        self.candidates = candidates
+        self.local_search = local_search
+        self.rng = np.random.default_rng() if rng is None else rng
+
+        self.tau0 = 1.0 / (n * max(initial_cost, 1))
+        self.pheromone = np.full((n, n), self.tau0)
+        self.best_path = np.array(initial_path, dtype=np.int32)
+        self.best_cost = int(initial_cost)
+        self.iteration = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['instance'] = None
+        state['_heuristic'] = None
+        state['_reduced'] = None
+        return state
+
+    def attach(self, instance):
+        """
+        Attach the colony to the instance (e.g. in a worker process).
+        """
+        self.instance = instance
+        self._heuristic = None
+        self._reduced = None
+
+    @property
+    def heuristic(self):
+        """
+        Heuristic values of the arcs 1 / (cost + 1) raised to the power beta, computed once per process.
+        """
+        if self._heuristic is None:
+            self._heuristic = (1.0 / (self.instance.costs + 1.0)) ** self.beta
+        return self._heuristic
+
+    @property
+    def reduced(self):
+        """
+        Reduction matrix of the instance (see reduction_matrix), computed once per process.
+        """
+        if self._reduced is None:
+            self._reduced = reduction_matrix(self.instance)
+        return self._reduced
+
+    def iterate(self, deadline=None):
+        """
+        One iteration: construction of all ants, local search on the best ant and global pheromone update on the
+        arcs of the best path found so far.
+
+        :param deadline: time.time() by which the local search has to stop (optional)
+        """
+        instance = self.instance
+        paths, costs = construct_ants(instance, self.pheromone, self.heuristic, self.ants, self.q0, self.rho, self.tau0,
+                                      self.rng, self.candidates, self.reduced)
+        path, cost = paths[costs.argmin()], int(costs.min())
+        if self.local_search is not None:
+            budget = None if deadline is None else max(deadline - time.time(), 0.0)
+            path, cost = self.local_search(instance, path, time_budget=budget)
+        if cost < self.best_cost:
+            self.best_path, self.best_cost = np.array(path, dtype=np.int32), int(cost)
+
+        # global update: pheromone = (1 - alpha) * pheromone + alpha / best cost on the arcs of the best path
+        tails, heads = self.best_path[:-1], self.best_path[1:]
+        self.pheromone[tails, heads] = (1 - self.alpha) * self.pheromone[tails, heads] \
+            + self.alpha / max(self.best_cost, 1)
+        self.iteration += 1
+
+    def run(self, iterations=None, deadline=None):
+        """
+        Iterate until the number of iterations or the deadline (time.time()) is reached.
+        """
+        done = 0
+        while (iterations is None or done < iterations) and (deadline is None or time.time() < deadline):
+            self.iterate(deadline)
+            done += 1
+
+    def adopt(self, path, cost):
+        """
+        Replace the best path of the colony if the given one is cheaper (exchange between colonies).
+        """
+        if cost < self.best_cost:
+            self.best_path, self.best_cost = np.array(path, dtype=np.int32), int(cost)
+
+
+def _colony_worker(connection, instance_spec, name, colony):
+    """
+    Long-lived worker process of ant_colony_system, owns one colony (and its pheromone matrix) for the whole run.
+    Every message (iterations, deadline, path, cost) lets the colony adopt the best path of all colonies (or None)
+    and run the iterations of an epoch, the reply is the best path of the colony, its cost and its number of
+    iterations. The message None ends the worker.
+
+    :param connection: end of a multiprocessing Pipe
+    :param instance_spec: SharedArrays.spec of the shared instance
+    :param name: name of the instance
+    :param colony: Colony
+    """
+    colony.attach(attach_instance(instance_spec, name))
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        iterations, deadline, path, cost = message
+        if path is not None:
+            colony.adopt(path, cost)
+        colony.run(iterations, deadline)
+        connection.send((colony.best_path, colony.best_cost, colony.iteration))
+    connection.close()
+
+
+def ant_colony_system(arcs, time_budget=60.0, iterations=None, colonies=1, exchange_interval=10, seed=None,
+                      verbose=False, **parameters):
+    """
+    Find a solution for the sequential ordering problem with the Ant Colony System, hybridized with a local search
+    on the best ant of every iteration (HAS-SOP).
+
+    The colonies start from the greedy solution improved by the local search (within half of the time budget).
+    With colonies > 1 every colony lives in its own worker process attached to the instance in shared memory; after
+    every exchange_interval iterations (an epoch) only the best path of all colonies and its cost are sent to every
+    colony, where the path gets the global pheromone update.
+
+    :param arcs: Matrix representation of the sequential ordering problem or SOPInstance.
+    :param time_budget: wall-clock budget in seconds (None: only iterations).
+    :param iterations: maximal number of iterations of every colony (None: only time_budget).
+    :param colonies: number of colonies (= number of worker processes if > 1).
+    :param exchange_interval: number of iterations of an epoch.
+    :param seed: seed of the random streams of the colonies (optional).
+    :param verbose: print the best cost after every epoch.
+    :param parameters: parameters of the colonies (see Colony: ants, q0, alpha, rho, beta, candidates, local_search)
+    :return: Tuple of a list of vertices in order of visit for the best solution found and the cost of that solution.
+    """
+    assert time_budget is not None or iterations is not None, '[aco] time_budget or iterations has to be given'
+    instance = as_instance(arcs)
+    started = time.time()
+    deadline = None if time_budget is None else started + time_budget
+
+    path, cost = greedy(instance)
+    local_search = parameters.get('local_search', sop_3_exchange)
+    if local_search is not None:
+        # at most half of the remaining time, the ants get the rest
+        budget = None if deadline is None else max(deadline - time.time(), 0.0) / 2
+        path, cost = local_search(instance, path, time_budget=budget)
+
+    streams = np.random.SeedSequence(seed).spawn(colonies)
+    swarm = [Colony(instance, path, cost, rng=np.random.default_rng(stream), **parameters) for stream in streams]
+
+    def epochs():
+        done = 0
+        while (iterations is None or done < iterations) and (deadline is None or time.time() < deadline):
+            epoch = exchange_interval if iterations is None else min(exchange_interval, iterations - done)
+            yield epoch
+            done += epoch
+
+    def report(iteration, cost):
+        if verbose:
+            print('aco: iteration {}, best cost {}, {:.1f}s'.format(iteration, cost, time.time() - started))
+
+    if colonies == 1:
+        colony = swarm[0]
+        for epoch in epochs():
+            colony.run(epoch, deadline)
+            report(colony.iteration, colony.best_cost)
+        return colony.best_path.tolist(), colony.best_cost
+
+    best_path, best_cost = swarm[0].best_path, swarm[0].best_cost
+    with share_instance(instance) as shared_instance:
+        connections = []
+        try:
+            for colony in swarm:
+                connection, worker_connection = mp.Pipe()
+                worker = mp.Process(target=_colony_worker, daemon=True,
+                                    args=(worker_connection, shared_instance.spec, instance.name, colony))
+                worker.start()
+                worker_connection.close()
+                connections.append((connection, worker))
+
+            exchange = None
+            for epoch in epochs():
+                for connection, _ in connections:
+                    connection.send((epoch, deadline, exchange, best_cost))
+                bests = [connection.recv() for connection, _ in connections]
+                path, cost, iteration = min(bests, key=lambda best: best[1])
+                if cost < best_cost:
+                    best_path, best_cost = path, cost
+                exchange = best_path
+                report(iteration, best_cost)
+        finally:
+            for connection, _ in connections:
+                connection.send(None)
+            for connection, worker in connections:
+                worker.join()
+                connection.close()
+
+    return best_path.tolist(), best_cost
+
+
+if __name__ == "__main__":
+    from helper.parser import filenames
+    from helper.cache import load_instance
+    from helper.verification import verify_solution
+
+    sop_path = "../../Data/course_benchmark_instances/"
+    sop_files, _ = filenames([sop_path, sop_path])
+
+    for sop_file in sop_files:
+        instance = load_instance(sop_file)
+        time_start = time.perf_counter()
+        path, cost = ant_colony_system(instance, time_budget=60, colonies=max(1, mp.cpu_count() - 1), seed=0)
+        assert verify_solution(instance, np.array(path))[0] == cost
+        print('{:15s} aco {:8d} ({:.1f}s)'.format(instance.name, cost, time.perf_counter() - time_start))
@@ -1,41 +1,287 @@
-# Greedy Method
+# Beam Search Method
+import multiprocessing as mp
+from contextlib import ExitStack
+import numpy as np
+from helper.instance import as_instance
+from helper.shared import SharedArrays, initialize_worker, share_instance, worker_state
 
 
-def beam_search(arcs, beam_width):
+def select_best(values, k):
+    """
+    Select the k smallest values without sorting all of them.
+
+    :param values: 1 dim numpy array
+    :param k: number of values to select, at most values.size
+    :return: indices of the k smallest values in ascending order of value; ties are broken by index,
+             so the result equals np.argsort(values, kind='stable')[:k]
+    """
+    if k >= values.size:
+        return np.argsort(values, kind='stable')
+
+    # value of the k-th smallest entry, everything below is selected and the rest is filled by index order
+    threshold = np.partition(values, k - 1)[k - 1]
+    below = np.flatnonzero(values < threshold)
+    equal = np.flatnonzero(values == threshold)[:k - below.size]
+    selected = np.concatenate((below, equal))
+
+    return selected[np.argsort(values[selected], kind='stable')]
+
+
+def duplicates(keys):
+    """
+    :param keys: 1 dim numpy array
+    :return: bool mask of the entries whose key already occurs at a lower index
+    """
+    mask = np.ones(keys.size, dtype=bool)
+    mask[np.unique(keys, return_index=True)[1]] = False
+    return mask
+
+
+def reconstruct_path(parent_layers, vertex_layers, start, state=0):
+    """
+    Follow the parent pointers of a state back to the start vertex.
+
+    :param parent_layers: list of arrays, index of the parent state of every state of a layer
+    :param vertex_layers: list of arrays, vertex appended by every state of a layer
+    :param start: start vertex
+    :param state: index of the state in the last layer
+    :return: list of vertices in order of visit
+    """
+    path = [0] * (len(vertex_layers) + 1)
+    path[0] = start
+    for layer in range(len(vertex_layers) - 1, -1, -1):
+        path[layer + 1] = int(vertex_layers[layer][state])
+        state = parent_layers[layer][state]
+    return path
+
+
+def expand_states(costs, live, visited_bits, remaining, last, cost, hashes, beam_width, zobrist=None,
+                  candidate_lists=None):
+    """
+    Expand all states of a beam by every ready vertex and select the cheapest children.
+
+    :param costs: cost matrix of the instance
+    :param live: mask of the live arcs of the instance (see helper.precedence.LiveArcs)
+    :param visited_bits: visited vertices of the states as packed bitmask (one row per state)
+    :param remaining: number of unvisited predecessors of every vertex (one row per state)
+    :param last: last vertex of every state
+    :param cost: cost of every state
+    :param hashes: Zobrist hash of the visited set of every state
+    :param beam_width: maximal number of children to select
+    :param zobrist: None or tuple of the Zobrist keys (visited, last) of the vertices; if given, only the
+                    cheapest child for every visited set and last vertex is kept (dominance filter)
+    :param candidate_lists: None or CandidateLists (see helper.candidates); if given, a state is only expanded
+                            by its ready candidates, or by every ready vertex if none of them is ready
+    :return: tuple of arrays (cost, parent state, vertex) of the selected children, sorted by cost,
+             ties in order of the states and vertices
+    """
+    n = costs.shape[0]
+    big_value = np.iinfo(np.int64).max
+
+    visited = np.unpackbits(visited_bits, axis=1, count=n).view(bool)
+    if candidate_lists is None:
+        ready = (remaining == 0) & ~visited & live[last]
+
+        # cost of every (state, vertex) pair, infeasible pairs get the largest value
+        candidates = np.where(ready, cost[:, np.newaxis] + costs[last], big_value).ravel()
+
+        def children(selected):
+            return np.divmod(selected, n)
+    else:
+        columns, ready, full, ready_full = candidate_lists.restrict(
+            last, lambda rows, columns: (remaining[rows[:, np.newaxis], columns] == 0)
+            & ~visited[rows[:, np.newaxis], columns])
+
+        # O(k) children of every state with a ready candidate, O(n) of the others
+        candidates = np.concatenate((np.where(ready, cost[:, np.newaxis] + costs[last[:, np.newaxis], columns],
+                                              big_value).ravel(),
+                                     np.where(ready_full, cost[full, np.newaxis] + costs[last[full]],
+                                              big_value).ravel()))
+        child_parents = np.concatenate((np.arange(last.size).repeat(columns.shape[1]), full.repeat(n)))
+        child_vertices = np.concatenate((columns.ravel(), np.tile(np.arange(n), full.size)))
+        ready = np.concatenate((ready.ravel(), ready_full.ravel()))
+
+        # children in order of the states and vertices, so ties are broken as without candidates
+        order = np.argsort(child_parents * n + child_vertices, kind='stable')
+        candidates, child_parents, child_vertices, ready = (candidates[order], child_parents[order],
+                                                            child_vertices[order], ready[order])
+
+        def children(selected):
+            return child_parents[selected], child_vertices[selected]
+
+    number_ready = np.count_nonzero(ready)
+
+    # keep the cheapest candidates, in order of the states and vertices in case of ties
+    selected = select_best(candidates, min(beam_width, number_ready))
+    parents, vertices = children(selected)
+
+    # dominance filter: candidates with the same visited set and last vertex can be completed in exactly
+    # the same ways; the selection is sorted by cost, so every repeated key is a more expensive duplicate
+    # which gets discarded before selecting again
+    while zobrist is not None:
+        dominated = duplicates(hashes[parents] ^ zobrist[0][vertices] ^ zobrist[1][vertices])
+        if not dominated.any():
+            break
+        candidates[selected[dominated]] = big_value
+        number_ready -= np.count_nonzero(dominated)
+
+        selected = select_best(candidates, min(beam_width, number_ready))
+        parents, vertices = children(selected)
+
+    return candidates[selected], parents, vertices
+
+
+def merge_children(children, n, hashes, beam_width, zobrist=None):
+    """
+    Merge the children selected from several parts of a beam (see expand_states) into one selection.
+
+    :param children: list of tuples (cost, parent state, vertex), parent states are global indices
+    :param n: number of vertices
+    :param hashes: Zobrist hash of the visited set of every parent state
+    :param beam_width: maximal number of children to select
+    :param zobrist: None or Zobrist keys (visited, last) of the vertices for the dominance filter
+    :return: tuple of arrays (cost, parent state, vertex) like expand_states
+    """
+    cost, parents, vertices = (np.concatenate(arrays) for arrays in zip(*children))
+
+    # same order as if the whole beam had been expanded at once
+    order = np.lexsort((parents * n + vertices, cost))
+    if zobrist is not None:
+        order = order[~duplicates(hashes[parents[order]] ^ zobrist[0][vertices[order]] ^ zobrist[1][vertices[order]])]
+    order = order[:beam_width]
+
+    return cost[order], parents[order], vertices[order]
+
+
+def _expand_part(params):
+    """
+    Expand the states first, ..., stop - 1 of the shared beam in a worker process.
+
+    :param params: tuple (first, stop, beam_width, dominance, candidates)
+    :return: children selected from this part of the beam (see expand_states), with global parent indices
+    """
+    first, stop, beam_width, dominance, candidates = params
+    beam = worker_state['beam']
+    instance = worker_state['instance']
+    cost, parents, vertices = expand_states(instance.costs, instance.live_arcs.mask,
+                                            beam['visited_bits'][first:stop], beam['remaining'][first:stop],
+                                            beam['last'][first:stop], beam['cost'][first:stop],
+                                            beam['hashes'][first:stop], beam_width,
+                                            worker_state['zobrist'] if dominance else None,
+                                            None if candidates is None else instance.candidates(candidates))
+    return cost, parents + first, vertices
+
+
+def beam_search(arcs, beam_width, dominance=False, processes=1, candidates=None):
     """
     Apply a beam search of the specified width on the sequential ordering
     problem defined by the specified matrix and return the best solution found.
 
-    :param arcs: Matrix representation of the sequential ordering problem.
+    The beam is stored as numpy arrays (one row per state): the visited vertices as a bitmask, the last
+    vertex, the cost and the number of unvisited predecessors of every vertex. This way the expansion of
+    all states of a layer is a single masked operation on a (beam width x n) matrix.
+
+    With dominance=True states with the same visited set and the same last vertex are merged and only the
+    cheapest one is kept (restricted dynamic programming). States are identified by a 64 bit Zobrist hash of
+    the visited set and the last vertex; collisions are possible in theory but extremely unlikely.
+
+    With processes > 1 the states of every layer are split among a pool of worker processes. The instance and
+    the beam are kept in shared memory, every worker selects the best children of its part of the beam and
+    the parts are merged into the new beam. Without dominance the result is the same as with one process;
+    with dominance it may differ slightly, since duplicates across the parts are only removed when merging.
+
+    With candidates=k a state is only expanded by the ready vertices among the k cheapest live successors of
+    its last vertex (see helper.candidates), so a layer has O(k) instead of O(n) children per state; states
+    without a ready candidate are expanded by every ready vertex.
+
+    :param arcs: Matrix representation of the sequential ordering problem or SOPInstance.
     :param beam_width: width of the beam search.
+    :param dominance: merge equivalent states and keep only the cheapest one.
+    :param processes: number of processes used to expand the beam.
+    :param candidates: length of the candidate lists (optional).
     :return: Tuple of a list of vertices in order of visit for the best solution found and the cost of that solution.
     """
-    paths = [([0], 0)]
-    vertices = range(arcs.shape[0])
+    instance = as_instance(arcs)
+    costs = instance.costs
+    n = instance.n
+    candidate_lists = None if candidates is None else instance.candidates(candidates)
+
+    # successor_matrix[v, s] is 1 if v must precede s, subtracting a row updates the predecessor counters
+    counter_type = np.int16 if n <= np.iinfo(np.int16).max else np.int32
+    successor_matrix = instance.precedence.T.astype(counter_type)
+
+    # beam with the start vertex as only state
+    visited_bits = np.zeros((1, (n + 7) // 8), dtype=np.uint8)
+    visited_bits[0, instance.start >> 3] |= 0x80 >> (instance.start & 7)
+    last = np.array([instance.start])
+    cost = np.zeros(1, dtype=np.int64)
+    remaining = instance.pred_count.astype(counter_type)[np.newaxis, :] - successor_matrix[instance.start]
+
+    # paths are only stored as parent pointers: for every layer the index of the parent state in the
+    # previous layer and the vertex appended to it
+    parent_layers = []
+    vertex_layers = []
+
+    # random keys of the vertices for hashing the states (fixed seed to get reproducible results)
+    zobrist = np.random.default_rng(0).integers(0, np.iinfo(np.uint64).max, size=(2, n), dtype=np.uint64,
+                                                endpoint=True)
+    hashes = zobrist[0][last]
+
+    with ExitStack() as stack:
+        if processes > 1:
+            # the instance and the beam (with room for beam_width states) are shared with the workers
+            shared_instance = stack.enter_context(share_instance(instance))
+            shared_beam = stack.enter_context(SharedArrays({
+                'visited_bits': np.zeros((beam_width, visited_bits.shape[1]), dtype=np.uint8),
+                'remaining': np.zeros((beam_width, n), dtype=counter_type),
+                'last': np.zeros(beam_width, dtype=last.dtype),
+                'cost': np.zeros(beam_width, dtype=np.int64),
+                'hashes': np.zeros(beam_width, dtype=np.uint64),
+            }))
+            pool = stack.enter_context(mp.Pool(processes, initialize_worker,
+                                               (shared_instance.spec, {'beam': shared_beam.spec},
+                                                {'zobrist': zobrist})))
+
+        for _ in range(n - 1):
+            if processes > 1 and last.size >= processes:
+                beam = shared_beam.arrays
+                size = last.size
+                beam['visited_bits'][:size] = visited_bits
+                beam['remaining'][:size] = remaining
+                beam['last'][:size] = last
+                beam['cost'][:size] = cost
+                beam['hashes'][:size] = hashes
+
+                bounds = np.linspace(0, size, processes + 1).astype(int)
+                parts = pool.map(_expand_part, [(bounds[i], bounds[i + 1], beam_width, dominance, candidates)
+                                                for i in range(processes)])
+                cost, parents, vertices = merge_children(parts, n, hashes, beam_width,
+                                                         zobrist if dominance else None)
+            else:
+                cost, parents, vertices = expand_states(costs, instance.live_arcs.mask, visited_bits, remaining,
+                                                        last, cost, hashes, beam_width, zobrist if dominance else None,
+                                                        candidate_lists)
 
-    for _ in range(len(vertices) - 1):
-        new_paths = []
-        for path, cost in paths:
-            for i in vertices:
-                if (i not in path and
-                        # all precedence constraints are respected
-                        all(j in path for j in vertices if arcs[i][j] == -1)):
-                    new_paths.append((path + [i], cost + arcs[path[-1]][i]))
+            if cost.size == 0:
+                raise RuntimeError("No feasible solution found for this instance.")
 
-        if len(new_paths) == 0:
-            raise RuntimeError("No feasible solution found for this instance.")
-        else:
-            new_paths.sort(key=lambda path_and_cost: path_and_cost[1])
-            paths = new_paths[:beam_width]
+            # build the new beam only from the selected candidates
+            visited_bits = visited_bits[parents]
+            visited_bits[np.arange(parents.size), vertices >> 3] |= (0x80 >> (vertices & 7)).astype(np.uint8)
+            remaining = remaining[parents] - successor_matrix[vertices]
+            hashes = hashes[parents] ^ zobrist[0][vertices]
+            last = vertices
+            parent_layers.append(parents.astype(np.int32))
+            vertex_layers.append(vertices.astype(np.int32))
 
-    return paths[0]
+    return reconstruct_path(parent_layers, vertex_layers, instance.start), int(cost[0])
 
 
 if __name__ == "__main__":
-    from helper.parser import parser, filenames
+    from helper.parser import filenames
+    from helper.cache import load_instance
     from helper.verification import check_solution
     import os.path
-    import numpy as np
     import time
 
     # directory paths
@@ -47,17 +293,17 @@ if __name__ == "__main__":
 
     # fill arrays
     for sop_file in sop_files:
-        arcs = parser(sop_file, True)
         instance_name = os.path.basename(sop_file[:-4])
+        instance = load_instance(sop_file, True)
 
         print('Applying beam search algorithm to', instance_name)
-        time_start = time.clock()
-        path, total_cost = beam_search(arcs, arcs.shape[0])
-        print('Time:', time.clock() - time_start, 'seconds.')
+        time_start = time.perf_counter()
+        path, total_cost = beam_search(instance, instance.n)
+        print('Time:', time.perf_counter() - time_start, 'seconds.')
 
         print('Path:', path)
         print('Total cost:', total_cost)
-        print('Verified cost:', check_solution(arcs, np.array(path)))
+        print('Verified cost:', check_solution(instance, np.array(path)))
 
         print('Saving {}.sol'.format(instance_name))
         with open(r'solutions_beam_search_method_V\{}.sol'.format(instance_name), 'w') as fp:
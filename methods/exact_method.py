@@ -1,238 +1,230 @@
 # exact method for the sop problem
 
-from gurobipy import *
+import time
 import numpy as np
+from scipy import sparse
+from scipy.optimize import milp, LinearConstraint, Bounds
+from helper.instance import as_instance
 
-n = 0
-prec_matrix = None
-cost_matrix = None
-
-def subtourelim(model, where):
-    if where == GRB.Callback.MIPSOL:
-        # make a list of edges selected in the solution
-        vals = model.cbGetSolution(model._vars)
-        # only takes selected vars
-        selected = tuplelist((i,j) for i,j in model._vars.keys() if vals[i,j] > 0.5)
-        # filter the corresponding helper variables
-
-
-        #whole_tour = get_whole_tour(selected)
-        # find the shortest cycle in the selected edge list
-        tour = subtour(selected)
-        if len(tour) < n:
-            # add subtour elimination constraint for every pair of cities in tour
-            for perm in itertools.permutations(tour):
-                model.cbLazy(quicksum(model._vars[perm[i], perm[(i+1) % len(perm)]]
-                                      for i in range(len(perm)))
-                             <= len(perm)-1)
-
-            model.cbLazy(quicksum(model._vars[i, j]
-                                  for i, j in itertools.combinations(tour, 2))
-                         <= len(tour)-1)
-        """
-        corresp_helper = []
-        for var in model._Model__vars:
-            if var.VarName[0] == 'h':
-                i = int(var.VarName.split('(')[1].split(',')[0])
-                j = int(var.VarName.split(')')[0].split(',')[1])
-                corresp_helper += [(var, (i, j))]
-
-        for index_1, i in enumerate(whole_tour):
-            for index_2, j in enumerate(whole_tour[index_1:]):
-                if prec_matrix[i, j]:
-                    for helper in corresp_helper:
-                        if helper[1] == (i,j):
-                            helper_i_j = helper[0]
-                        elif helper[1] == (j,i):
-                            helper_j_i =  helper[0]
-                    model.cbLazy(helper_i_j - helper_j_i >= 0)
-                    #m.addConstr(helper(j, i) - helper(i, j) >= 0)
-        """
-
-
-def get_whole_tour(edges):
-    unvisited = list(range(n))
-    cycle = []  # initial length has 1 more city
-    while unvisited:  # true if list is non-empty
-        thiscycle = []
-        neighbors = unvisited
-        while neighbors:
-            current = neighbors[0]
-            thiscycle.append(current)
-            unvisited.remove(current)
-            neighbors = [j for i, j in edges.select(current, '*') if j in unvisited]
-        cycle += thiscycle
-    return cycle
-
-
-
-
-def subtour(edges):
-    unvisited = list(range(n))
-    cycle = range(n+1) # initial length has 1 more city
-    while unvisited: # true if list is non-empty
-        thiscycle = []
-        neighbors = unvisited
-        while neighbors:
-            current = neighbors[0]
-            thiscycle.append(current)
-            unvisited.remove(current)
-            neighbors = [j for i,j in edges.select(current,'*') if j in unvisited]
-        if len(cycle) > len(thiscycle):
-            cycle = thiscycle
-    return cycle
-
-
-def gurobi_problem(arcs):
-
-    ## initialization
-    # create model
-    m = Model()
-
-    # separate cost and precedence matrix
-    # make global for subtourelim
-    global cost_matrix
-    global prec_matrix
-
-
-    cost_matrix = get_cost_matrix(arcs)
-    prec_matrix = get_prec_matrix(arcs)
-
-
-
-    # size of the problem
-
-    global n
-    n = prec_matrix.shape[0]
-
-    prec_matrix[n-1, 0] = 0
-
-
-    # add decision variables to the model
-    vars = tupledict()
-    for i in range(n):
-        for j in range(n):
-            vars[i, j] = m.addVar(name='var({},{})'.format(i,j), vtype=GRB.BINARY, obj=cost_matrix[i,j])
-
-    helper = tupledict()
-    for i in range(n):
-        for j in range(n):
-            helper[i,j] = m.addVar(name='helper({},{})'.format(i,j), vtype=GRB.INTEGER)
-
-
-    ## add constraints
-    # sub tour and precedence constraints will be added as lazy constraints
-
-    # can only leave every node once
-    # but never leave the last node
-    m.addConstrs(vars.sum(i, '*') == 1 for i in range(n))
-
-    # artificially add connection between last and first node
-    m.addConstr(vars[n-1,0] == 1)
-
-    # have to enter every node exactly once ( except first node 0)
-    m.addConstrs(vars.sum('*', j) == 1 for j in range(n))
+# gurobi is optional, without it the model is solved with HiGHS (scipy.optimize.milp)
+try:
+    import gurobipy as gp
+    from gurobipy import GRB
+except ImportError:
+    gp = None
 
-    m.addConstrs(vars[i,i] == 0 for i in range(n))
 
-    ###########
-    # prec constraints
+class SOPModel:
+    """
+    Mixed integer program of the sop (single commodity flow formulation) as sparse matrices, independent of a solver.
+
+    Every arc which can be part of a feasible path (see helper.precedence.LiveArcs) and the artificial arc from the
+    last to the first vertex get a binary variable x (arc used) and an integer variable y (flow on the arc):
+        - every vertex is left exactly once and entered exactly once, the artificial arc is used (bounds)
+        - n - 1 units of flow leave the first vertex, every other vertex consumes one unit
+        - flow only on used arcs: y <= (n - 1) x
+        - precedence: if j has to precede i, the flow entering j is at least the flow entering i
+
+    Attributes:
+        n - number of vertices
+        tails, heads - arc of every x variable (the y variables are in the same order after them)
+        c - objective, costs of the arcs for x and 0 for y
+        integrality - 1 for every variable (all variables are integer)
+        lb, ub - bounds of the variables
+        A - sparse constraint matrix (csr)
+        sense - '=', '<' or '>' for every row of A
+        rhs - right hand side of every row of A
+        build_time - seconds needed to build the model
+    """
 
-    m.addConstr(helper.sum(0, '*') == n-1) # have n-1 packages leaving from 0
+    def __init__(self, arcs):
+        """
 
-    for i in range(n):
-        for j in range(n): # only variables which are included in the path can be greater 0
-            m.addConstr(helper[i,j] <= (n-1) * vars[i,j])
+        :param arcs: Matrix representation of the sequential ordering problem or SOPInstance.
+        """
+        time_start = time.perf_counter()
+        instance = as_instance(arcs)
+        n = self.n = instance.n
+
+        # only arcs which can be part of a feasible path get variables
+        # plus the artificial connection between last and first node
+        live = instance.live_arcs.mask.copy()
+        live[n - 1, 0] = True
+        tails, heads = np.nonzero(live)
+        m = tails.size
+        arc = np.arange(m)
+        self.tails, self.heads = tails, heads
+        self.removed = instance.live_arcs.removed
+
+        self.c = np.concatenate((instance.costs[tails, heads], np.zeros(m))).astype(float)
+        self.integrality = np.ones(2 * m)
+        self.lb = np.zeros(2 * m)
+        self.ub = np.concatenate((np.ones(m), np.full(m, np.inf)))
+        self.lb[np.flatnonzero((tails == n - 1) & (heads == 0))] = 1  # artificially add connection between last and first node
+
+        # rows: out degree (n), in degree (n), flow leaving 0 (1), linking (m), flow conservation (n - 1)
+        source = np.flatnonzero(tails == 0)
+        conservation = 2 * n + 1 + m
+        out_flow, in_flow = np.flatnonzero(tails > 0), np.flatnonzero(heads > 0)
+        rows = np.concatenate((tails, n + heads, np.full(source.size, 2 * n), 2 * n + 1 + arc, 2 * n + 1 + arc,
+                               conservation + tails[out_flow] - 1, conservation + heads[in_flow] - 1))
+        columns = np.concatenate((arc, arc, m + source, m + arc, arc, m + out_flow, m + in_flow))
+        values = np.concatenate((np.ones(2 * m + source.size), np.ones(m), np.full(m, -(n - 1.0)),
+                                 np.ones(out_flow.size), -np.ones(in_flow.size)))
+        structure = sparse.csr_matrix((values, (rows, columns)), shape=(conservation + n - 1, 2 * m))
+        sense = ['='] * (2 * n + 1) + ['<'] * m + ['='] * (n - 1)
+        rhs = [1.0] * (2 * n) + [n - 1.0] + [0.0] * m + [-1.0] * (n - 1)
+
+        # precedence rows (j precedes i): inflow(j) - inflow(i) >= 0, as product of a (pairs x n) matrix
+        # with the incidence matrix of the flow entering every vertex
+        precedence = instance.precedence.copy()
+        precedence[0, :] = precedence[:, 0] = False
+        i, j = np.nonzero(precedence)
+        pairs = sparse.csr_matrix((np.concatenate((np.ones(i.size), -np.ones(i.size))),
+                                   (np.tile(np.arange(i.size), 2), np.concatenate((j, i)))), shape=(i.size, n))
+        inflow = sparse.csr_matrix((np.ones(m), (heads, m + arc)), shape=(n, 2 * m))
+
+        self.A = sparse.vstack((structure, pairs @ inflow), format='csr')
+        self.sense = np.array(sense + ['>'] * i.size)
+        self.rhs = np.array(rhs + [0.0] * i.size)
+        self.build_time = time.perf_counter() - time_start
+
+    def tour(self, x):
+        """
+        :param x: values of the variables of a solution
+        :return: list of vertices in order of visit (following the used arcs from the first vertex)
+        """
+        used = x[:self.tails.size] > 0.5
+        successor = np.full(self.n, -1)
+        successor[self.tails[used]] = self.heads[used]
+        tour = [0]
+        while tour[-1] != self.n - 1 and len(tour) <= self.n:
+            tour.append(int(successor[tour[-1]]))
+        return tour
 
-    # for every visited node leave one package (out one less than in)
-    m.addConstrs(helper.sum(i, '*') - helper.sum('*', i) == -1 for i in range(1,n))
 
-    for i in range(1,n):
-        for j in range(1,n):
-            if prec_matrix[i,j]:
-                m.addConstr(helper.sum('*', j) - helper.sum('*', i) >= 0)
+def solve_highs(model, time_limit=None, verbose=True):
+    """
+    Solve the model with HiGHS (scipy.optimize.milp).
 
+    :return: tuple of the values of the variables (None if no solution was found), status as gurobi status code
+             (2 optimal, 9 time limit, 3 infeasible), runtime, mip gap and objective bound
+    """
+    lower = np.where(model.sense == '<', -np.inf, model.rhs)
+    upper = np.where(model.sense == '>', np.inf, model.rhs)
+    options = {'disp': verbose}
+    if time_limit is not None:
+        options['time_limit'] = time_limit
 
-    # set up final model properties
-    m._vars = vars
+    time_start = time.perf_counter()
+    result = milp(model.c, integrality=model.integrality, bounds=Bounds(model.lb, model.ub),
+                  constraints=LinearConstraint(model.A, lower, upper), options=options)
+    runtime = time.perf_counter() - time_start
 
-    m.setObjective(quicksum(vars[i,j]*cost_matrix[i,j] for i in range(n) for j in range(n)), sense=GRB.MINIMIZE)
+    status = {0: 2, 1: 9, 2: 3}.get(result.status, result.status)
+    return (result.x, status, runtime, getattr(result, 'mip_gap', None), getattr(result, 'mip_dual_bound', None))
 
-    # use lazy constraints
-    m.Params.lazyConstraints = 0
 
-    # set time limit (2 minutes)
-    m.setParam('TimeLimit', 2 * 60)
+def solve_gurobi(model, time_limit=None, verbose=True):
+    """
+    Solve the model with Gurobi. Only the api of Gurobi 8 is used (addVars and one linear expression per row of
+    the constraint matrix), the matrix interface needs Gurobi 9.
 
-    #optimize
-    m.optimize()# subtourelim)
+    :return: same as solve_highs
+    """
+    if gp is None:
+        raise ImportError("gurobipy is not installed, use solve_highs")
+    m = gp.Model()
+    m.Params.OutputFlag = int(verbose)
+    if time_limit is not None:
+        m.Params.TimeLimit = time_limit
+
+    # x binary (bounds 0 / 1), y integer
+    variables = m.addVars(model.c.size, lb=model.lb.tolist(), ub=np.minimum(model.ub, GRB.INFINITY).tolist(),
+                          obj=model.c.tolist(), vtype=GRB.INTEGER)
+    x = [variables[k] for k in range(model.c.size)]
+    relation = {'=': lambda lhs, rhs: lhs == rhs, '<': lambda lhs, rhs: lhs <= rhs, '>': lambda lhs, rhs: lhs >= rhs}
+    A = model.A
+    m.addConstrs(relation[model.sense[row]](
+        gp.LinExpr(A.data[A.indptr[row]:A.indptr[row + 1]].tolist(),
+                   [x[k] for k in A.indices[A.indptr[row]:A.indptr[row + 1]]]), model.rhs[row])
+        for row in range(A.shape[0]))
+    m.ModelSense = GRB.MINIMIZE
+    m.optimize()
+
+    values = np.array(m.getAttr('X', x)) if m.SolCount > 0 else None
+    return values, m.Status, m.Runtime, m.MIPGap if m.SolCount > 0 else None, m.ObjBound
+
+
+def exact_problem(arcs, backend='highs', time_limit=2 * 60, verbose=True):
+    """
+    Solve the sequential ordering problem with a mixed integer program (see SOPModel).
+
+    :param arcs: Matrix representation of the sequential ordering problem or SOPInstance.
+    :param backend: 'highs' (scipy.optimize.milp) or 'gurobi'
+    :param time_limit: time limit of the solver in seconds (2 minutes by default)
+    :param verbose: print the log of the solver and the results
+    :return: list [tour, value, runtime, stopping criterion (gurobi status code), mip gap, objective bound,
+             build time]; tour is empty and value -1 if no solution was found
+    """
+    instance = as_instance(arcs)
+    model = SOPModel(instance)
+    if verbose:
+        print("Eliminated {} of {} arcs which can not be part of a feasible path.".format(model.removed,
+                                                                                         model.n * (model.n - 1)))
+        print("Model with {} variables and {} constraints built in {:.3f}s.\n".format(model.c.size, model.A.shape[0],
+                                                                                      model.build_time))
 
+    solve = {'highs': solve_highs, 'gurobi': solve_gurobi}[backend]
+    x, status, runtime, gap, bound = solve(model, time_limit, verbose)
 
     # console output and saving results with respect to opt. outcomes
-    if m.SolCount > 0:
-        vals = m.getAttr('x', vars)
-        selected = tuplelist((i, j) for i, j in vals.keys() if vals[i, j] > 0.5)
-
-        tour = subtour(selected)
-        assert len(tour) == n
-
-        if m.status == 2:
-            print("Optimal Solution was found.")
-        if m.status == 9:
-            print("Time limit was exceeded.")
-
-        print('')
-        print('Best tour found:  %s' % str(tour))
-        print('Cost of the tour: %g' % m.objVal)
-        print('')
+    if x is not None:
+        tour = model.tour(x)
+        assert len(tour) == model.n
 
         from helper.verification import check_solution
 
-        value = check_solution(arcs, np.array(tour))
-
-        print("Solution valid: " + str(value >= 0) + "\n")
+        value = check_solution(instance, np.array(tour))
 
         # get post opt data: solution, value, stopping criterion, runtime,
-        opt_data = [tour, value, m.Runtime, m.status, m.mipgap, m.objbound]
+        opt_data = [tour, value, runtime, status, gap, bound, model.build_time]
     else:
-        print("No Solution was found...")
-        if m.status == 9:
-            print("Time Limit was exceeded without solution")
-
-        opt_data = [[], -1, m.Runtime, m.status, m.mipgap, m.objbound]
-
-
-
-    print('#################################\n#################################\n')
+        opt_data = [[], -1, runtime, status, gap, bound, model.build_time]
+
+    if verbose:
+        if x is None:
+            print("No Solution was found...")
+            if status == 9:
+                print("Time Limit was exceeded without solution")
+        else:
+            if status == 2:
+                print("Optimal Solution was found.")
+            if status == 9:
+                print("Time limit was exceeded.")
+
+            print('')
+            print('Best tour found:  %s' % str(tour))
+            print('Cost of the tour: %g' % value)
+            print('Build time: %.3fs, solve time: %.3fs' % (model.build_time, runtime))
+            print('')
+            print("Solution valid: " + str(value >= 0) + "\n")
+
+        print('#################################\n#################################\n')
 
     return opt_data
 
 
-def get_prec_matrix(arcs):
-    """
-    Extract the precedence constraints from the initial arcs matrix.
-
-    :param arcs: numpy array
-    :return: numpy array, same size as input;
-    matrix with only with precedence constraints
-    (a_ij is one if i must precede j, 0 otherwise)
-    """
-
-    return (arcs == -1).astype(float)
-
-def get_cost_matrix(arcs):
+def gurobi_problem(arcs):
     """
-    Extract only the costs for traversing the arcs from the initial arcs matrix.
-
-    :param arcs: numpy array
-    :return: numpy array, same size as input; returns only the costs of the arcs given by the problem
-    (no recedence constraints included in this matrix)
+    Solve the sequential ordering problem with Gurobi (see exact_problem).
     """
+    return exact_problem(arcs, backend='gurobi')
 
-    return np.multiply(arcs, arcs != -1).astype(int)
 
 if __name__ == "__main__":
-    from helper.parser import parser, filenames
+    from helper.parser import filenames
+    from helper.cache import load_instance
 
     # specify used methods
     solution_methods = {
@@ -240,7 +232,7 @@ if __name__ == "__main__":
     }
 
     solvers = {  # the actual functions for the methods
-        'exact_method': gurobi_problem,
+        'exact_method': exact_problem,  # or gurobi_problem
     }
 
     # directory paths
@@ -260,11 +252,11 @@ if __name__ == "__main__":
     for i in range(len(sop_files)):
     #for i in [2]:
         # solution = parser(sol_files[i], True)
-        arcs = parser(sop_files[i], True)
+        instance = load_instance(sop_files[i], True)
 
-        if arcs.shape[0] > filter_size and filter == 'easy':  # filter out 'big' instances
+        if instance.n > filter_size and filter == 'easy':  # filter out 'big' instances
             continue
-        instances += [(arcs, sop_files[i])]
+        instances += [(instance, sop_files[i])]
 
     for instance in instances:  # for each instance
         for method in solution_methods:  # go through all methods
@@ -273,10 +265,10 @@ if __name__ == "__main__":
                 instance_name = instance[1][:-4].split("/")[3]
                 with open("data_exact_method/{}_{}.txt".format(method, instance_name), "w+") as text_file:
                     text_file.write(
-                        "solution, value, runtime, stopping criterion, mipgap, objbound\n" +
-                        "{}, {}, {}, {}, {}, {}".format(
+                        "solution, value, runtime, stopping criterion, mipgap, objbound, build time\n" +
+                        "{}, {}, {}, {}, {}, {}, {}".format(
                             opt_data[0], opt_data[1], opt_data[2], opt_data[3],
-                            opt_data[4], opt_data[5]
+                            opt_data[4], opt_data[5], opt_data[6]
                         )
                     )
                 # save found solution in .sol file
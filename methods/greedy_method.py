@@ -1,43 +1,67 @@
 # Greedy Method
+from helper.instance import as_instance
+from helper.frontier import ReadySet
 
 
-def greedy(arcs):
+def greedy(arcs, candidates=None):
     """
     Find a feasible solution for the sequential ordering problem
     defined by the specified matrix using a greedy algorithm.
 
-    :param arcs: Matrix representation of the sequential ordering problem.
+    The vertices which can be visited next are kept in a ready set (see helper.frontier) and only the live
+    arcs leaving the last vertex (see helper.precedence.LiveArcs) are considered, so every step is one argmin
+    over the ready vertices among them.
+
+    With candidates=k only the k cheapest live successors of the last vertex (see helper.candidates) are
+    considered; they are sorted by cost, so the first ready one is taken. All live successors are scanned
+    only if none of them is ready. The result is the same as without candidates.
+
+    :param arcs: Matrix representation of the sequential ordering problem or SOPInstance.
+    :param candidates: length of the candidate lists (optional).
     :return: Tuple of a list of vertices in order of visit for the solution found and the cost of that solution.
     """
+    instance = as_instance(arcs)
+    costs = instance.costs
+    live_successors = instance.live_arcs.successors
+    candidate_lists = None if candidates is None else instance.candidates(candidates)
     total_cost = 0
-    visited_vertices = [0]
-    big_value = arcs.max() + 1
-    vertices = range(arcs.shape[0])
-    last_vertex = vertices[-1]
+    visited_vertices = [instance.start]
+    last_vertex = instance.end
+
+    frontier = ReadySet(instance)
+    frontier.visit(instance.start)
 
     while visited_vertices[-1] != last_vertex:
-        min_weight = big_value
-        next_vertex = -1
-
-        for i in vertices:
-            if (i not in visited_vertices and
-                    0 <= arcs[visited_vertices[-1]][i] < min_weight and
-                    # all precedence constraints are respected
-                    all(j in visited_vertices for j in vertices if arcs[i][j] == -1)):
-                min_weight = arcs[visited_vertices[-1]][i]
-                next_vertex = i
-
-        if next_vertex == -1:
+        if candidate_lists is not None:
+            nearest = candidate_lists.successors_of(visited_vertices[-1])
+            ready = nearest[frontier.ready[nearest]]
+            if ready.size:
+                next_vertex = int(ready[0])
+                frontier.visit(next_vertex)
+                total_cost += int(costs[visited_vertices[-1], next_vertex])
+                visited_vertices.append(next_vertex)
+                continue
+
+        successors = live_successors[visited_vertices[-1]]
+        candidates = successors[frontier.ready[successors]]
+
+        if candidates.size == 0:
             raise RuntimeError("No feasible solution found for this instance.")
 
+        # cheapest ready vertex, first one in case of ties
+        weights = costs[visited_vertices[-1], candidates]
+        next_vertex = int(candidates[weights.argmin()])
+
+        frontier.visit(next_vertex)
         visited_vertices.append(next_vertex)
-        total_cost += min_weight
+        total_cost += int(weights.min())
 
     return visited_vertices, total_cost
 
 
 if __name__ == "__main__":
-    from helper.parser import parser, filenames
+    from helper.parser import filenames
+    from helper.cache import load_instance
     import os.path
 
     # directory paths
@@ -49,11 +73,11 @@ if __name__ == "__main__":
 
     # fill arrays
     for sop_file in sop_files:
-        arcs = parser(sop_file, True)
         instance_name = os.path.basename(sop_file[:-4])
+        instance = load_instance(sop_file, True)
 
         print('Applying greedy algorithm to', instance_name)
-        path, total_cost = greedy(arcs)
+        path, total_cost = greedy(instance)
 
         print('Path:', path)
         print('Total cost:', total_cost)
@@ -1,70 +1,254 @@
 # Greedy randomized method
-import random
+import multiprocessing as mp
+import time
+import numpy as np
+from helper.instance import as_instance
+from helper.shared import initialize_worker, share_instance, worker_state
 
 
-def greedy_randomized(arcs):
+def _roulette(arc_costs, ready, draws):
+    """
+    Roulette wheel selection of one ready column per row with weights between 1.5 (cheapest arc) and 0.5 (most
+    expensive arc), uniform if all costs are equal.
+
+    :param arc_costs: costs of the arcs to every column (one row per rollout)
+    :param ready: bool mask of the columns which can be selected
+    :param draws: uniform random number in [0, 1) of every row
+    :return: selected column of every row
+    """
+    arc_costs = arc_costs.astype(float)
+    min_cost = np.where(ready, arc_costs, np.inf).min(axis=1, keepdims=True)
+    cost_difference = np.where(ready, arc_costs, -np.inf).max(axis=1, keepdims=True) - min_cost
+    cost_difference[cost_difference == 0] = np.inf
+    weights = np.where(ready, 1.5 - (arc_costs - min_cost) / cost_difference, 0)
+
+    cumulative = np.cumsum(weights, axis=1)
+    if not (cumulative[:, -1] > 0).all():
+        raise RuntimeError("No feasible solution found for this instance.")
+    return np.argmax(cumulative > draws[:, np.newaxis] * cumulative[:, -1:], axis=1)
+
+
+def greedy_randomized_batch(instance, batch_size, rng, bound=None, candidates=None, deadline=None):
+    """
+    Run several randomized greedy constructions in lockstep.
+
+    Every rollout appends one vertex per step, chosen among the ready vertices (all predecessors visited) with
+    probabilities that map the costs of the arcs linearly to weights between 1.5 (cheapest arc) and 0.5 (most
+    expensive arc). The state of all rollouts is kept in 2 dim arrays (one row per rollout), so one step of
+    all rollouts is a handful of numpy operations.
+
+    With candidates=k the roulette wheel of a rollout only contains the ready vertices among the k cheapest live
+    successors of its last vertex (see helper.candidates); rollouts without a ready candidate choose among all
+    ready vertices.
+
+    :param instance: SOPInstance
+    :param batch_size: number of rollouts
+    :param rng: numpy random generator
+    :param bound: rollouts are abandoned as soon as their partial cost reaches this value (optional)
+    :param candidates: length of the candidate lists (optional)
+    :param deadline: time.time() at which all rollouts of the batch are abandoned (optional)
+    :return: tuple of the paths (one row per rollout) and the costs of the completed rollouts
+    """
+    n = instance.n
+    costs = instance.costs
+    live = instance.live_arcs.mask
+    candidate_lists = None if candidates is None else instance.candidates(candidates)
+    counter_type = np.int16 if n <= np.iinfo(np.int16).max else np.int32
+    successor_matrix = instance.precedence.T.astype(counter_type)
+
+    # number of unvisited predecessors of every vertex, visited vertices are marked with -1
+    remaining = np.tile(instance.pred_count.astype(counter_type) - successor_matrix[instance.start], (batch_size, 1))
+    remaining[:, instance.start] = -1
+    paths = np.empty((batch_size, n), dtype=np.int32)
+    paths[:, 0] = instance.start
+    cost = np.zeros(batch_size, dtype=np.int64)
+    rollouts = np.arange(batch_size)  # index of every remaining row in the batch
+
+    for step in range(1, n):
+        if deadline is not None and time.time() >= deadline:
+            return paths[:0], cost[:0]
+        last = paths[:, step - 1]
+        # random numbers are drawn for the whole batch, so a rollout does not depend on abandoned ones
+        draws = rng.random(batch_size)[rollouts]
+
+        if candidate_lists is None:
+            full = np.arange(last.size)
+            ready_full = (remaining == 0) & live[last]
+        else:
+            nearest, ready, full, ready_full = candidate_lists.restrict(
+                last, lambda rows, columns: remaining[rows[:, np.newaxis], columns] == 0)
+            restricted = np.flatnonzero(ready.any(axis=1))
+
+            vertices = np.empty(last.size, dtype=np.int64)
+            columns = _roulette(costs[last[restricted, np.newaxis], nearest[restricted]], ready[restricted],
+                                draws[restricted])
+            vertices[restricted] = nearest[restricted, columns]
+
+        if full.size:
+            columns = _roulette(costs[last[full]], ready_full, draws[full])
+            if candidate_lists is None:
+                vertices = columns
+            else:
+                vertices[full] = columns
+
+        paths[:, step] = vertices
+        remaining -= successor_matrix[vertices]
+        remaining[np.arange(len(vertices)), vertices] = -1
+        cost += costs[last, vertices]
+
+        # early abandonment of rollouts which can not beat the bound any more
+        if bound is not None:
+            alive = cost < bound
+            if not alive.all():
+                paths, remaining, cost, rollouts = paths[alive], remaining[alive], cost[alive], rollouts[alive]
+                if cost.size == 0:
+                    break
+
+    return paths, cost
+
+
+def greedy_randomized(arcs, rng=None, candidates=None):
     """
     Find a feasible solution for the sequential ordering problem
     defined by the specified matrix using a greedy randomized algorithm.
 
-    :param arcs: Matrix representation of the sequential ordering problem.
+    :param arcs: Matrix representation of the sequential ordering problem or SOPInstance.
+    :param rng: numpy random generator (optional)
+    :param candidates: length of the candidate lists (optional, see greedy_randomized_batch)
     :return: List of vertices in order of visit for the solution found.
     """
-    total_cost = 0
-    visited_vertices = [0]
-    vertices = range(arcs.shape[0])
-    last_vertex = vertices[-1]
-
-    while visited_vertices[-1] != last_vertex:
-        possible_next_vertices = []
-        next_vertices_costs = []
-
-        for i in vertices:
-            if (i not in visited_vertices and
-                    0 <= arcs[visited_vertices[-1]][i] and
-                    # all precedence constraints are respected
-                    all(j in visited_vertices for j in vertices if arcs[i][j] == -1)):
-                possible_next_vertices.append(i)
-                next_vertices_costs.append(arcs[visited_vertices[-1]][i])
-
-        if not possible_next_vertices:
-            raise RuntimeError("No feasible solution found for this instance.")
-
-        min_cost = min(next_vertices_costs)
-        cost_difference = max(next_vertices_costs) - min_cost
-        visited_vertices += random.choices(possible_next_vertices,
-                                           # Map the costs inversely to weights
-                                           # between 0.5 (max cost) and 1.5 (min cost)
-                                           (1.5 - (cost - min_cost) / cost_difference for cost in next_vertices_costs)
-                                           if cost_difference > 0 else None)
-        total_cost += arcs[visited_vertices[-2]][visited_vertices[-1]]
-
-    return visited_vertices, total_cost
-
-
-def best_greedy_randomized(arcs):
+    instance = as_instance(arcs)
+    paths, costs = greedy_randomized_batch(instance, 1, np.random.default_rng() if rng is None else rng,
+                                           candidates=candidates)
+
+    return paths[0].tolist(), int(costs[0])
+
+
+def best_greedy_randomized(arcs, runs=None, time_budget=None, batch_size=64, seed=None, candidates=None):
     """
     Find a feasible solution for the sequential ordering problem defined by the specified
     matrix using a randomized greedy algorithm repeatedly and choosing the best result.
 
-    :param arcs: Matrix representation of the sequential ordering problem.
+    The rollouts are run in batches (see greedy_randomized_batch); rollouts whose partial cost reaches the
+    best cost found so far are abandoned.
+
+    :param arcs: Matrix representation of the sequential ordering problem or SOPInstance.
+    :param runs: number of rollouts, n^2 by default where n is the number of vertices.
+    :param time_budget: stop after this number of seconds, also within a batch (optional).
+    :param batch_size: number of rollouts run in lockstep.
+    :param seed: seed of the random generator (optional).
+    :param candidates: length of the candidate lists (optional, see greedy_randomized_batch).
     :return: List of vertices in order of visit for the solution found.
     """
+    instance = as_instance(arcs)
+    rng = np.random.default_rng(seed)
+    runs = instance.n ** 2 if runs is None else runs
+    deadline = None if time_budget is None else time.time() + time_budget
+
     best_path = []
-    best_cost = arcs.max() * arcs.shape[0]  # Impossibly large cost
+    best_cost = np.iinfo(np.int64).max  # Impossibly large cost
 
-    # Run the greedy randomized function n^2 times where n is the number of vertices.
-    for i in range(arcs.size):
-        path, cost = greedy_randomized(arcs)
-        if cost < best_cost:
-            best_path = path
-            best_cost = cost
+    done = 0
+    while done < runs and (deadline is None or time.time() < deadline):
+        paths, costs = greedy_randomized_batch(instance, min(batch_size, runs - done), rng, best_cost, candidates,
+                                               deadline)
+        done += min(batch_size, runs - done)
+        if costs.size > 0 and costs.min() < best_cost:
+            best_path = paths[costs.argmin()].tolist()
+            best_cost = int(costs.min())
 
     return best_path, best_cost
 
 
+def _run_rollouts(params):
+    """
+    Run batches of rollouts in a worker process until its number of runs, the deadline or the target cost is reached.
+
+    :param params: tuple (seed sequence, runs, deadline, target cost, batch size, candidates)
+    :return: tuple of the best path, its cost, the number of rollouts started and the number of completed ones
+    """
+    seed_sequence, runs, deadline, target_cost, batch_size, candidates = params
+    instance = worker_state['instance']
+    best_cost = worker_state['best_cost']
+    rng = np.random.default_rng(seed_sequence)
+
+    best_path = []
+    local_best_cost = np.iinfo(np.int64).max
+
+    done = completed = 0
+    while done < runs and (deadline is None or time.time() < deadline):
+        # prune with the best cost found by any worker
+        if target_cost is not None and best_cost.value <= target_cost:
+            break
+        paths, costs = greedy_randomized_batch(instance, min(batch_size, runs - done), rng, best_cost.value,
+                                               candidates, deadline)
+        done += min(batch_size, runs - done)
+        completed += costs.size
+
+        if costs.size > 0 and costs.min() < local_best_cost:
+            best_path = paths[costs.argmin()].tolist()
+            local_best_cost = int(costs.min())
+            with best_cost.get_lock():
+                best_cost.value = min(best_cost.value, local_best_cost)
+
+    return best_path, local_best_cost, done, completed
+
+
+def parallel_greedy_randomized(arcs, processes=None, runs=None, time_budget=None, target_cost=None,
+                               batch_size=64, seed=None, candidates=None):
+    """
+    Run the randomized greedy algorithm on a pool of worker processes and choose the best result.
+
+    Every worker gets its own random stream spawned from the seed, so a fixed seed, number of processes and
+    number of runs give the same best cost on every call. The instance is shared through shared memory and the best cost found so
+    far is shared between the workers, which abandon rollouts that can not beat it any more.
+
+    :param arcs: Matrix representation of the sequential ordering problem or SOPInstance.
+    :param processes: number of worker processes, number of cpus by default.
+    :param runs: total number of rollouts, n^2 by default where n is the number of vertices.
+    :param time_budget: wall-clock budget in seconds (optional).
+    :param target_cost: stop as soon as a solution with at most this cost is found (optional).
+    :param batch_size: number of rollouts run in lockstep by a worker.
+    :param seed: seed of the random streams (optional).
+    :param candidates: length of the candidate lists (optional, see greedy_randomized_batch).
+    :return: tuple of the best path, its cost and a dict of statistics: rollouts (started), completed, abandoned
+             (cut short by the bound or the deadline), seconds and rollouts_per_second (completed ones)
+    """
+    instance = as_instance(arcs)
+    processes = mp.cpu_count() if processes is None else processes
+    runs = instance.n ** 2 if runs is None else runs
+
+    time_start = time.time()
+    deadline = None if time_budget is None else time_start + time_budget
+    best_cost = mp.Value('q', np.iinfo(np.int64).max)
+
+    # split the runs among the workers, every worker gets an independent random stream
+    worker_runs = [runs // processes + (i < runs % processes) for i in range(processes)]
+    streams = np.random.SeedSequence(seed).spawn(processes)
+
+    with share_instance(instance) as shared_instance:
+        with mp.Pool(processes, initialize_worker, (shared_instance.spec, None, {'best_cost': best_cost})) as pool:
+            results = pool.map(_run_rollouts, [(streams[i], worker_runs[i], deadline, target_cost, batch_size,
+                                                candidates) for i in range(processes)])
+
+    seconds = time.time() - time_start
+    best_path, cost, _, _ = min(results, key=lambda result: result[1])
+    rollouts = sum(result[2] for result in results)
+    completed = sum(result[3] for result in results)
+    statistics = {
+        'rollouts': rollouts,
+        'completed': completed,
+        'abandoned': rollouts - completed,
+        'seconds': seconds,
+        'rollouts_per_second': completed / seconds if seconds > 0 else float('inf'),
+    }
+
+    return best_path, cost, statistics
+
+
 if __name__ == "__main__":
-    from helper.parser import parser, filenames
+    from helper.parser import filenames
+    from helper.cache import load_instance
     import os.path
 
     # directory paths
@@ -76,11 +260,11 @@ if __name__ == "__main__":
 
     # fill arrays
     for sop_file in sop_files:
-        arcs = parser(sop_file, True)
         instance_name = os.path.basename(sop_file[:-4])
+        instance = load_instance(sop_file, True)
 
         print('Applying greedy algorithm to', instance_name)
-        path, total_cost = greedy_randomized(arcs)
+        path, total_cost = greedy_randomized(instance)
 
         print('Path:', path)
         print('Total cost:', total_cost)
@@ -0,0 +1,220 @@
+# Or-opt and 2h-opt local search with don't-look bits and candidate lists
+
+import time
+import numpy as np
+from collections import deque
+from helper.instance import as_instance
+from helper.moves import Tour
+
+# Both searches only generate moves which add an arc to one of the k cheapest live neighbours of a vertex (the
+# candidate lists of helper.candidates). Or-opt moves a segment of at most three vertices, an exchange of two
+# adjacent segments of the path (see helper.moves.Tour.exchange), 2h-opt moves a single vertex (an insertion move,
+# see helper.moves.Tour.insert).
+# A vertex is searched again only if one of its arcs changed (don't-look bits), so a pass touches the
+# neighbourhood of the changed arcs only.
+
+
+def _best_move(tour, moves):
+    """
+    :param tour: Tour
+    :param moves: (m, 3) int array of exchanges (h, i, j), invalid rows are skipped
+    :return: (delta, h, i, j) of the best improving feasible exchange or None
+    """
+    h, i, j = moves.T
+    valid = (h >= 0) & (h < i) & (i < j) & (j <= tour.n - 2)
+    h, i, j = h[valid], i[valid], j[valid]
+    path, costs = tour.path, tour.costs
+    deltas = (costs[path[h], path[i + 1]] + costs[path[j], path[h + 1]] + costs[path[i], path[j + 1]]).astype(np.int64) \
+        - costs[path[h], path[h + 1]] - costs[path[i], path[i + 1]] - costs[path[j], path[j + 1]]
+
+    # feasibility is only checked for improving moves, the best one first
+    for m in np.argsort(deltas, kind='stable'):
+        if deltas[m] >= 0:
+            break
+        if tour.exchange_feasible(h[m], i[m], j[m]):
+            return int(deltas[m]), int(h[m]), int(i[m]), int(j[m])
+    return None
+
+def _best_insertion(tour, moves, deltas):
+    """
+    :param tour: Tour
+    :param moves: (m, 2) int array of insertions (i, j), invalid rows are skipped
+    :param deltas: cost delta of every insertion
+    :return: (delta, i, j) of the best improving feasible insertion or None
+    """
+    i, j = moves.T
+    valid = (i >= 1) & (i <= tour.n - 2) & (j >= 1) & (j <= tour.n - 2) & (i != j)
+    i, j, deltas = i[valid], j[valid], deltas[valid]
+
+    # feasibility is only checked for improving moves, the best one first
+    for m in np.argsort(deltas, kind='stable'):
+        if deltas[m] >= 0:
+            break
+        if tour.insertion_feasible(i[m], j[m]):
+            return int(deltas[m]), int(i[m]), int(j[m])
+    return None
+
+def _exchange(tour, moves):
+    """
+    Apply the best improving exchange of moves.
+
+    :return: vertices at the changed arcs or None if no move was applied
+    """
+    move = _best_move(tour, moves)
+    if move is None:
+        return None
+    _, h, i, j = move
+    touched = tour.path[[h, h + 1, i, i + 1, j, j + 1]]
+    tour.exchange(h, i, j)
+    return touched
+
+def _insertion(tour, moves, deltas):
+    """
+    Apply the best improving insertion of moves.
+
+    :return: vertices at the changed arcs or None if no move was applied
+    """
+    move = _best_insertion(tour, moves, deltas)
+    if move is None:
+        return None
+    _, i, j = move
+    before = tour.path[[i - 1, i, i + 1]]
+    tour.insert(i, j)
+    return np.concatenate((before, tour.path[[j - 1, j + 1]]))
+
+def _or_opt_moves(tour, vertex, candidates, max_length):
+    """
+    Moves of the segments of at most max_length vertices which start or end with vertex. A segment path[i..e] is
+    inserted after one of the candidate predecessors of its first vertex or before one of the candidate successors
+    of its last vertex.
+    """
+    p = int(tour.position[vertex])
+    moves = []
+    for length in range(1, max_length + 1):
+        for i in sorted({p, p - length + 1}):
+            e = i + length - 1
+            if i < 1 or e > tour.n - 2:
+                continue
+            # insertion between path[k] and path[k + 1]
+            k = np.concatenate((tour.position[candidates.predecessors_of(tour.path[i])],
+                                tour.position[candidates.successors_of(tour.path[e])] - 1)).astype(np.int64)
+            forward, backward = k[k > e], k[k < i - 1]
+            moves.append(np.column_stack((np.full(forward.size, i - 1), np.full(forward.size, e), forward)))
+            moves.append(np.column_stack((backward, np.full(backward.size, i - 1), np.full(backward.size, e))))
+    return np.concatenate(moves) if moves else np.empty((0, 3), dtype=np.int64)
+
+def _two_h_opt_moves(tour, vertex, candidates):
+    """
+    Insertions which add the arc (vertex, c) for a candidate successor c: c is moved directly behind vertex or
+    vertex directly in front of c.
+
+    :return: (m, 2) int array of insertions (i, j) and their cost deltas
+    """
+    p = int(tour.position[vertex])
+    q = tour.position[candidates.successors_of(vertex)].astype(np.int64)
+    after, before = q[q > p + 1], q[q < p]
+
+    # c behind vertex: one move of every candidate
+    moves = np.concatenate((np.column_stack((after, np.full(after.size, p + 1))),
+                            np.column_stack((before, np.full(before.size, p)))))
+    deltas = np.array([tour.insertion_delta(i, j) if 1 <= i <= tour.n - 2 else 0 for i, j in moves],
+                      dtype=np.int64)
+
+    # vertex in front of c: all moves of vertex in one step
+    if 1 <= p <= tour.n - 2:
+        targets = np.concatenate((after - 1, before))
+        moves = np.concatenate((moves, np.column_stack((np.full(targets.size, p), targets))))
+        deltas = np.concatenate((deltas, tour.insertion_deltas(p)[targets]))
+    return moves, deltas
+
+def _local_search(instance, path, improve, time_budget, verbose, name):
+    """
+    Applies the best improving move found for the first vertex of the queue until no vertex is left.
+
+    :param improve: function (tour, vertex) -> vertices at the arcs changed by the applied move (None if there is
+                    no improving move)
+    :return: Tuple of a list of vertices in order of visit for the improved solution and the cost of that solution.
+    """
+    tour = Tour(instance, path)
+    initial_cost = tour.cost
+    started = time.perf_counter()
+
+    # vertices whose don't-look bit is off, in the order of the path
+    queue = deque(int(vertex) for vertex in tour.path[:-1])
+    queued = np.zeros(instance.n, dtype=bool)
+    queued[tour.path[:-1]] = True
+    moves = 0
+    while queue:
+        if time_budget is not None and time.perf_counter() - started > time_budget:
+            break
+        vertex = queue.popleft()
+        queued[vertex] = False
+        touched = improve(tour, vertex)
+        if touched is None:
+            continue
+
+        moves += 1
+        for other in touched:
+            if other != instance.end and not queued[other]:
+                queued[other] = True
+                queue.append(int(other))
+
+    if verbose:
+        print('{}: {} moves, cost {} -> {}, {:.3f}s'.format(name, moves, initial_cost, tour.cost,
+                                                             time.perf_counter() - started))
+    return tour.path.tolist(), tour.cost
+
+def or_opt(arcs, path, max_length=3, neighbours=10, time_budget=None, verbose=False):
+    """
+    Improve a feasible path by moving segments of 1 to max_length vertices (Or-opt) without reversing them.
+
+    :param arcs: Matrix representation of the sequential ordering problem or SOPInstance.
+    :param path: feasible path (list or array of all vertices from start to end vertex)
+    :param max_length: maximal number of vertices of a moved segment
+    :param neighbours: size of the candidate lists (cheapest live successors and predecessors of every vertex)
+    :param time_budget: optional time limit in seconds
+    :param verbose: print the number of moves, the costs and the time
+    :return: Tuple of a list of vertices in order of visit for the improved solution and the cost of that solution.
+    """
+    instance = as_instance(arcs)
+    candidates = instance.candidates(neighbours)
+    return _local_search(instance, path,
+                         lambda tour, vertex: _exchange(tour, _or_opt_moves(tour, vertex, candidates, max_length)),
+                         time_budget, verbose, 'or-opt')
+
+def two_h_opt(arcs, path, neighbours=10, time_budget=None, verbose=False):
+    """
+    Improve a feasible path with the path preserving moves of 2h-opt (hybrid 2-opt). A 2-exchange on a directed
+    path would reverse the part between the exchanged arcs, so only the node insertions of 2h-opt are used: for
+    a new arc (a, c) either c is moved behind a or a in front of c.
+
+    :param arcs: Matrix representation of the sequential ordering problem or SOPInstance.
+    :param path: feasible path (list or array of all vertices from start to end vertex)
+    :param neighbours: size of the candidate lists (cheapest live successors of every vertex)
+    :param time_budget: optional time limit in seconds
+    :param verbose: print the number of moves, the costs and the time
+    :return: Tuple of a list of vertices in order of visit for the improved solution and the cost of that solution.
+    """
+    instance = as_instance(arcs)
+    candidates = instance.candidates(neighbours)
+    return _local_search(instance, path,
+                         lambda tour, vertex: _insertion(tour, *_two_h_opt_moves(tour, vertex, candidates)),
+                         time_budget, verbose, '2h-opt')
+
+if __name__ == "__main__":
+    from helper.parser import filenames
+    from helper.cache import load_instance
+    from helper.verification import verify_solution
+    from methods.greedy_method import greedy
+
+    # improvement of the greedy solutions of all instances
+    sop_path = "../../Data/course_benchmark_instances/"
+    sop_files, _ = filenames([sop_path, sop_path])
+
+    for sop_file in sop_files:
+        instance = load_instance(sop_file)
+        print(instance.name)
+        path, cost = greedy(instance)
+        for search in (or_opt, two_h_opt):
+            improved_path, improved_cost = search(instance, path, verbose=True)
+            assert verify_solution(instance, np.array(improved_path))[0] == improved_cost
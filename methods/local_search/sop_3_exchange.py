@@ -0,0 +1,181 @@
+# SOP-3-exchange local search (Gambardella, Dorigo: An Ant Colony System Hybridized with a New Local Search for the
+# Sequential Ordering Problem, 2000)
+
+import time
+import numpy as np
+from helper.instance import as_instance
+from helper.moves import Tour
+
+
+def _first_blocked(positions, labels, rows, default):
+    """
+    :param positions: labelled positions in ascending order
+    :param labels: label of every labelled position
+    :param rows: positions i
+    :param default: result for the rows without such a position
+    :return: for every row i the first labelled position q > i with label <= i
+    """
+    size = positions.size
+    if size == 0:
+        return np.full(rows.size, default)
+
+    # sparse table: minima[level][k] = min(labels[k:k + 2 ** level])
+    minima = [labels]
+    while 2 ** len(minima) <= size:
+        step = 2 ** (len(minima) - 1)
+        minima.append(np.minimum(minima[-1][:-step], minima[-1][step:]))
+
+    # skip blocks of decreasing length which contain no label <= i (O(log n) per row)
+    k = np.searchsorted(positions, rows, side='right')
+    for level in range(len(minima) - 1, -1, -1):
+        table = minima[level]
+        inside = k < table.size
+        k += (inside & (table[np.minimum(k, table.size - 1)] > rows)) << level
+    return np.where(k < size, positions[np.minimum(k, size - 1)], default)
+
+def _best_exchange(path, position, costs, sources, targets, h):
+    """
+    Lexicographic search from h: all feasible exchanges of the segments left = path[h + 1..i] and
+    right = path[i + 1..j] with h < i < j <= n - 2 are evaluated at once.
+
+    Labeling: every position q gets the label lowest position after h of a predecessor of path[q] in the transitive
+    reduction. The right segment of left = path[h + 1..i] can grow until the first position q > i whose label is
+    at most i (the vertex there has a predecessor in the left segment). This limit is found in O(log n) for every
+    i (see _first_blocked), so only the feasible exchanges are generated and each of them is evaluated in O(1).
+
+    :param path: the path (or a reversed view of it)
+    :param position: position of every vertex in path
+    :param costs: C-contiguous cost matrix (transposed for a reversed path)
+    :param sources: preceding vertex of every arc of the transitive reduction
+    :param targets: following vertex of every arc of the transitive reduction
+    :param h: position before the left segment
+    :return: (delta, i, j) of the best feasible exchange or None if there is none
+    """
+    n = path.size
+    if h > n - 4:
+        return None
+
+    sources, targets = position[sources], position[targets]
+    after = sources > h
+    label = np.full(n, n, dtype=np.int64)
+    np.minimum.at(label, targets[after], sources[after])
+
+    # limit[i]: first position which cannot be part of the right segment if the left segment ends at i
+    rows = np.arange(h + 1, n - 2)
+    labeled = np.flatnonzero(label[:n - 1] < n)
+    limit = _first_blocked(labeled, label[labeled], rows, n - 1)
+
+    usable = limit > rows + 1
+    if not usable.any():
+        return None
+    rows, limit = rows[usable], limit[usable]
+
+    # the feasible exchanges (i, j) with i + 1 <= j < limit[i], row by row
+    counts = limit - rows - 1
+    ends = np.cumsum(counts)
+    columns = np.arange(ends[-1]) + np.repeat(rows + 1 - (ends - counts), counts)
+
+    # (a, b), (c, d), (e, f) are replaced by (a, d), (e, b), (c, f) with c = path[i] and e = path[j]:
+    # a term of i, a term of j and costs[c, f], gathered from the flat (contiguous) cost matrix
+    a, b = path[h], path[h + 1]
+    c, d = path[rows], path[rows + 1]
+    e, f = path[:-1], path[1:]
+    row_term = costs[a, d] - costs[c, d] - costs[a, b]
+    column_term = costs[e, b] - costs[e, f]
+    deltas = np.take(costs.ravel(), np.repeat(c * n, counts) + f[columns])
+    deltas += np.repeat(row_term, counts)
+    deltas += column_term[columns]
+    best = int(deltas.argmin())
+    row = int(np.searchsorted(ends, best, side='right'))
+    return int(deltas[best]), int(rows[row]), int(columns[best])
+
+def sop_3_exchange(arcs, path, time_budget=None):
+    """
+    Improve a feasible path with the SOP-3-exchange local search until it is locally optimal.
+
+    A move exchanges two adjacent segments of the path without reversing them (see helper.moves.Tour.exchange).
+    The vertices to search from are kept in a stack (initially the whole path); for a vertex at position h the
+    forward search evaluates all moves whose left segment starts after h and the backward search (the forward
+    search on the reversed path) all moves whose right segment ends before h. The best improving move found is
+    applied and the six vertices at the changed arcs are pushed on the stack again (searched in both directions).
+    A move also changes the segments of moves around it, so when the stack runs empty after some improvement it is
+    filled with the whole path again; the search ends after a pass without improvement (a local optimum).
+
+    :param arcs: Matrix representation of the sequential ordering problem or SOPInstance.
+    :param path: feasible path (list or array of all vertices from start to end vertex)
+    :param time_budget: optional time limit in seconds, the best path found so far is returned when it is reached
+    :return: Tuple of a list of vertices in order of visit for the improved solution and the cost of that solution.
+    """
+    instance = as_instance(arcs)
+    n = instance.n
+    tour = Tour(instance, path)
+    graph = instance.precedence_graph
+    sources = graph.reduced_idx
+    targets = np.repeat(np.arange(n, dtype=np.int32), graph.reduced_count)
+    costs, costs_reversed = np.ascontiguousarray(instance.costs), np.ascontiguousarray(instance.costs.T)
+
+    started = time.perf_counter()
+    stack, in_stack = [], np.zeros(n, dtype=bool)
+    # vertices pushed after a move are searched in both directions, the forward searches of a whole pass already
+    # cover every move
+    both_directions = np.zeros(n, dtype=bool)
+    improved = True
+    while stack or improved:
+        if time_budget is not None and time.perf_counter() - started > time_budget:
+            break
+        if not stack:
+            stack = [int(vertex) for vertex in tour.path[::-1]]
+            in_stack[:] = True
+            both_directions[:] = False
+            improved = False
+        vertex = stack.pop()
+        in_stack[vertex] = False
+        h = int(tour.position[vertex])
+
+        moves = []
+        forward = _best_exchange(tour.path, tour.position, costs, sources, targets, h)
+        if forward is not None:
+            moves.append((forward[0], h, forward[1], forward[2]))
+
+        # backward search: forward search on the reversed path, move (h', i', j') maps to (n-2-j', n-2-i', n-2-h')
+        if both_directions[vertex]:
+            backward = _best_exchange(tour.path[::-1], n - 1 - tour.position, costs_reversed, targets, sources,
+                                      n - 1 - h)
+            if backward is not None:
+                moves.append((backward[0], n - 2 - backward[2], n - 2 - backward[1], h - 1))
+
+        if not moves:
+            continue
+        delta, h, i, j = min(moves)
+        if delta >= 0:
+            continue
+
+        touched = tour.path[[h, h + 1, i, i + 1, j, j + 1]]
+        tour.exchange(h, i, j)
+        improved = True
+        for vertex in touched[::-1]:
+            both_directions[vertex] = True
+            if not in_stack[vertex]:
+                in_stack[vertex] = True
+                stack.append(int(vertex))
+
+    return tour.path.tolist(), tour.cost
+
+if __name__ == "__main__":
+    from helper.parser import filenames
+    from helper.cache import load_instance
+    from helper.verification import verify_solution
+    from methods.greedy_method import greedy
+
+    # improvement of the greedy solutions of all instances
+    sop_path = "../../Data/course_benchmark_instances/"
+    sop_files, _ = filenames([sop_path, sop_path])
+
+    for sop_file in sop_files:
+        instance = load_instance(sop_file)
+        path, cost = greedy(instance)
+        started = time.perf_counter()
+        improved_path, improved_cost = sop_3_exchange(instance, path)
+        elapsed = time.perf_counter() - started
+        assert verify_solution(instance, np.array(improved_path))[0] == improved_cost
+        print('{:15s} greedy {:8d} -> {:8d} ({:5.1f}s)'.format(instance.name, cost, improved_cost, elapsed))
@@ -1,8 +1,31 @@
 import os
-import pickle
 from datetime import datetime
 from methods.DPSO.DPSO import DPSO
-from helper.parser import parser, filenames
+from helper.instance import as_instance
+from helper.parser import filenames
+from helper.cache import load_instance
+
+
+def pso(arcs, iterations=5000, time_budget=None, stagnation=1000, engine='vectorized', pop_size=70, seed=None):
+    """
+    Find a solution for the sequential ordering problem with DPSO (parameters of the paper, see below).
+
+    :param arcs: Matrix representation of the sequential ordering problem or SOPInstance.
+    :param iterations: maximal number of iterations.
+    :param time_budget: stop after this many seconds (optional).
+    :param stagnation: stop if the best cost did not improve for this many iterations (optional).
+    :param engine: 'vectorized', 'pool' or 'islands' (see DPSO.optimize).
+    :param pop_size: number of particles.
+    :param seed: seed of the random generator (optional).
+    :return: Tuple of a list of vertices in order of visit for the best solution found and the cost of that solution.
+    """
+    instance = as_instance(arcs)
+    dpso = DPSO(pop_size=pop_size, coef_inertia=4.5, coef_personal=4.5, coef_social=2, particle_size=instance.n,
+                weights_matrix=instance, seed=seed)
+    dpso.optimize(out_file=os.devnull, iterations=iterations, verbose=False, engine=engine, time_budget=time_budget,
+                  stagnation=stagnation)
+    return dpso.full_particle(dpso.gbest).tolist(), int(dpso.cost(dpso.gbest))
+
 
 if __name__ == "__main__":
     files_sop, files_sol = filenames(('./solutions_dpso/', '../Data/course_benchmark_instances/'))
@@ -10,29 +33,33 @@ if __name__ == "__main__":
         start_time = datetime.now()
         print('started at', start_time)
 
-        arcs = parser(f_sop, True)
-        size = len(arcs)
+        instance = load_instance(f_sop, True)
+        size = instance.n
 
         pop_size = 70
         coef_inertia = 4.5
         coef_personal = 4.5
         coef_social = 2
         iterations = 5000
+        time_budget = None # seconds, e.g. 20 * 60
+        stagnation = 1000 # stop if the best cost did not improve for this many iterations
+        engine = 'vectorized' # or 'pool', 'islands' (one island per core)
 
         f_evo = f_sol.replace('solutions_dpso', 'solutions_evo').replace('.sol', '.evo')
 
-        f_pkl = f_sol.replace('solutions_dpso', 'solutions_pkl').replace('.sol', '.pkl')
-        if os.path.isfile(f_pkl):
-            print('LOADED OBJECT FROM PICKLE')
-            with open(f_pkl, mode='rb') as reader:
-                dpso = pickle.load(reader)
+        # the swarm is checkpointed regularly, an interrupted run continues from the last checkpoint
+        f_checkpoint = f_sol.replace('solutions_dpso', 'solutions_pkl').replace('.sol', '.npz')
+        if os.path.isfile(f_checkpoint):
+            print('LOADED SWARM FROM CHECKPOINT')
+            dpso = DPSO.from_checkpoint(f_checkpoint, instance)
         else:
             print('CREATED OBJECT FROM SCRATCH')
             # in paper, values for inertia and personal are both equal to 4.5 "social" parameter is automatically set
-            dpso = DPSO(pop_size=pop_size, coef_inertia=coef_inertia, coef_personal=coef_personal, coef_social=coef_social, particle_size=size, weights_matrix=arcs)
+            dpso = DPSO(pop_size=pop_size, coef_inertia=coef_inertia, coef_personal=coef_personal, coef_social=coef_social, particle_size=size, weights_matrix=instance)
             dpso.file_name = f_sop # will be added to constructor in the future
 
-        dpso.optimize(out_file=f_evo, iterations=iterations, verbose=True)
+        dpso.optimize(out_file=f_evo, iterations=iterations, verbose=True, engine=engine, time_budget=time_budget,
+                      stagnation=stagnation, checkpoint=f_checkpoint)
 
         str_cost = str(dpso.cost(dpso.gbest))
         str_particle = ','.join(map(lambda x: str(x), dpso.full_particle(dpso.gbest)))
@@ -54,9 +81,8 @@ if __name__ == "__main__":
             w.write(f'coef_personal = {coef_personal}\n')
             w.write(f'coef_social = {coef_social}\n')
             w.write(f'iterations = {iterations}\n')
-
-        with open(f_pkl, 'wb') as w:
-            pickle.dump(dpso, w)
+            w.write(f'engine = {engine}\n')
+            w.write(f'stopped after iteration = {dpso.iteration}\n')
 
         print('ended at', end_time)
         print('elapsed', (end_time - start_time))